@@ -0,0 +1,27 @@
+import sys
+import os
+import argparse
+
+curDir = os.path.abspath(os.getcwd())
+srcDir = os.path.join(curDir,'src')
+sys.path.append(curDir)
+sys.path.append(srcDir)
+
+import QtBatch
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Generate the reports listed in a manifest')
+    parser.add_argument('manifest', help='.csv or .json file with input, report_file_name, airport_name, way_name and agent_name per job')
+    parser.add_argument('--workers', type=int, default=None, help='number of reports generated at once (default: one per core)')
+    parser.add_argument('--keep-going', action='store_true', help='carry on with the other jobs when a report fails')
+    parser.add_argument('--log', default='batch.log', help='progress log file')
+    args = parser.parse_args()
+
+    jobs = QtBatch.readManifest(args.manifest)
+    failed = QtBatch.runBatch(jobs, workers=args.workers, keep_going=args.keep_going, log_file=args.log)
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,449 @@
+import sys
+import os
+import json
+import time
+import argparse
+import platform
+import datetime
+import numpy as np
+import pandas as pd
+
+curDir = os.path.abspath(os.getcwd())
+srcDir = os.path.join(curDir,'src')
+sys.path.append(curDir)
+sys.path.append(srcDir)
+
+import QtPDF
+import QtGrid
+import QtPlot
+import QtTiming
+import inputgen
+
+def loopTransform(df, id_list=None):
+    #Reference implementation of the former per-light loop of QtReport.__transformDF
+    if id_list is None:
+        id_list = np.sort(df['Light ID'].unique())
+
+    rows = []
+
+    for id in id_list:
+
+        imax = df.loc[df['Light ID'] == id]['I'].max()
+        maxIDF = df.loc[df['I'] == imax]
+        iavg = df.loc[df['Light ID'] == id]['I'].mean()
+
+        rows.append((id,maxIDF.iloc[0]['%ICAO'],iavg,imax,maxIDF.iloc[0]['H'],maxIDF.iloc[0]['V'],maxIDF.iloc[0]['C'],maxIDF.iloc[0]['S']))
+
+    return pd.DataFrame(rows,columns=('Light ID','%ICAO', 'Iavg','Imax','Hmax','Vmax','C','S')).set_index('Light ID')
+
+def benchTransform(sizes=(1000,10000,100000), loop_sample=200):
+
+    print('{0:>8} {1:>12} {2:>14} {3:>10}'.format('lights','summarize[s]','loop[s]','speedup'))
+
+    for light_num in sizes:
+
+        df = inputgen.makeLights(light_num, 0)
+
+        start = time.perf_counter()
+        QtPDF.summarize(df)
+        fast = time.perf_counter() - start
+
+        #Each iteration of the loop scans the whole frame, so time a sample of lights and scale up
+        sample = min(light_num,loop_sample)
+
+        start = time.perf_counter()
+        loopTransform(df,np.arange(1,sample+1))
+        loop = (time.perf_counter() - start)*light_num/sample
+
+        estimated = '' if sample == light_num else ' (est.)'
+
+        print('{0:>8} {1:>12.3f} {2:>14} {3:>9.0f}x'.format(light_num,fast,'{0:.2f}{1}'.format(loop,estimated),loop/fast))
+
+def benchGrid(light_num=500, tolerances=(0.0,2.0)):
+    from scipy.interpolate import griddata
+
+    df = inputgen.makeLights(light_num, 0)
+    index = QtPDF.QtLightIndex(df)
+    lights = [ index.light(id) for id in index.ids ]
+
+    #Interpolate every light with its own triangulation, as grid() used to
+    start = time.perf_counter()
+    for H, V, I in lights:
+        xi = np.linspace(H.min(), H.max(), 100)
+        yi = np.linspace(V.min(), V.max(), 100)
+        griddata((H, V), I, (xi[None,:], yi[:,None]), method='cubic')
+    base = time.perf_counter() - start
+
+    print('{0:>10} {1:>10} {2:>10} {3:>10}'.format('tolerance','layouts','time[s]','speedup'))
+    print('{0:>10} {1:>10} {2:>10.3f} {3:>10}'.format('griddata',light_num,base,''))
+
+    for tolerance in tolerances:
+
+        engine = QtGrid.QtGridEngine(tolerance=tolerance, max_layouts=light_num)
+
+        start = time.perf_counter()
+        engine.gridMany(*zip(*lights))
+        elapsed = time.perf_counter() - start
+
+        print('{0:>10} {1:>10} {2:>10.3f} {3:>9.1f}x'.format(tolerance,len(engine.layouts),elapsed,base/elapsed))
+
+def benchCompliance(light_num=10000):
+    import QtCompliance
+
+    df = inputgen.makeLights(light_num, 0)
+    index = QtPDF.QtLightIndex(df)
+
+    compliance = QtCompliance.QtCompliance(10000)
+
+    print('{0:>10} {1:>10} {2:>14}'.format('engine','time[s]','lights/s'))
+
+    for name, engine in (('linear',QtGrid.QtLinearEngine()), ('cubic',QtGrid.QtGridEngine(max_layouts=light_num))):
+
+        start = time.perf_counter()
+        compliance.checkLights(index, engine)
+        elapsed = time.perf_counter() - start
+
+        print('{0:>10} {1:>10.3f} {2:>14.0f}'.format(name,elapsed,light_num/elapsed))
+
+def benchContourFormats(modes=(('png',400),('png',150),('jpg',150),('svg',None)), light_num=5):
+    import tempfile
+    from weasyprint import HTML
+
+    df = inputgen.makeLights(light_num, 0)
+    index = QtPDF.QtLightIndex(df)
+    mtab_df = QtPDF.summarize(df, index)
+
+    XI, YI, Z = QtGrid.QtGridEngine().gridCube(*zip(*[ index.light(id) for id in index.ids ]))
+
+    gmaxI = np.nanmax(index.I)
+    scale = QtPlot.QtColourScale(np.linspace(0,gmaxI,16), np.arange(0,gmaxI,2000))
+
+    figure = QtPlot.contourFigure(light_num)
+
+    print('{0:>6} {1:>6} {2:>10} {3:>12} {4:>10} {5:>12}'.format('format','dpi','plot[s]','image[KiB]','pdf[s]','pdf[KiB]'))
+
+    with tempfile.TemporaryDirectory() as folder:
+
+        for image_format, dpi in modes:
+
+            save_as = os.path.join(folder, 'page.{0}'.format(image_format))
+
+            start = time.perf_counter()
+            figure.draw(XI, YI, Z, index.ids, mtab_df['Hmax'].values, mtab_df['Vmax'].values, scale=scale, save_as=save_as, dpi=dpi or 72)
+            plot = time.perf_counter() - start
+
+            #Embed the image the way the report template does
+            pdf_as = os.path.join(folder, 'page.pdf')
+            html_page = '<img style="width: 100%; height: auto" src="page.{0}" />'.format(image_format)
+
+            start = time.perf_counter()
+            HTML(string=html_page, base_url=folder).write_pdf(pdf_as)
+            pdf = time.perf_counter() - start
+
+            print('{0:>6} {1:>6} {2:>10.3f} {3:>12.0f} {4:>10.3f} {5:>12.0f}'.format(image_format,dpi or '-',plot,os.path.getsize(save_as)/1024,pdf,os.path.getsize(pdf_as)/1024))
+
+def benchTri(light_num=5, subdivs=(1,2,3)):
+    #Compare the contours of a page interpolated onto grids with those refined onto triangulations
+    df = inputgen.makeLights(light_num, 0)
+    index = QtPDF.QtLightIndex(df)
+    mtab_df = QtPDF.summarize(df, index)
+    lights = list(zip(*[ index.light(id) for id in index.ids ]))
+    Hmax, Vmax = mtab_df['Hmax'].values, mtab_df['Vmax'].values
+
+    gmaxI = np.nanmax(index.I)
+    scale = QtPlot.QtColourScale(np.linspace(0,gmaxI,16), np.arange(0,gmaxI,2000))
+
+    figure = QtPlot.contourFigure(light_num)
+
+    print('{0:>8} {1:>7} {2:>15} {3:>12} {4:>10}'.format('backend','subdiv','interpolate[s]','contour[s]','points'))
+
+    start = time.perf_counter()
+    XI, YI, Z = QtGrid.QtGridEngine().gridCube(*lights)
+    interpolate = time.perf_counter() - start
+
+    start = time.perf_counter()
+    figure.draw(XI, YI, Z, index.ids, Hmax, Vmax, scale=scale)
+    contour = time.perf_counter() - start
+
+    print('{0:>8} {1:>7} {2:>15.3f} {3:>12.3f} {4:>10}'.format('grid','-',interpolate,contour,Z[0].size))
+
+    for subdiv in subdivs:
+
+        start = time.perf_counter()
+        refined = QtGrid.QtTriEngine().refineMany(*lights, subdiv=subdiv)
+        interpolate = time.perf_counter() - start
+
+        start = time.perf_counter()
+        figure.drawTri(refined, index.ids, Hmax, Vmax, scale=scale)
+        contour = time.perf_counter() - start
+
+        print('{0:>8} {1:>7} {2:>15.3f} {3:>12.3f} {4:>10}'.format('tri',subdiv,interpolate,contour,len(refined[0][1])))
+
+def benchHTML(rows_per_page=(15,100,1000), light_num=10000, repeat=5):
+    #Time the html of one page, with the entries formatted by DataFrame.to_html on every page as
+    #before, and joined from the rows formatted once per report
+    from jinja2 import Environment, FileSystemLoader
+
+    df = inputgen.makeLights(light_num, 0)
+    mtab_df = QtPDF.summarize(df)
+
+    template = Environment(loader=FileSystemLoader('templates'), trim_blocks=True).get_template('template.html')
+    now = datetime.datetime.today()
+    context = { 'report_file_name': 'benchmark', 'air_port_name': 'Airport', 'way_name': 'Way', 'agent_name': 'Agent',
+                'date_of_report': now.strftime('%d/%m/%Y'), 'time_of_report': now.strftime('%H:%M:%S') }
+
+    start = time.perf_counter()
+    rows = QtPDF.tableRows(mtab_df)
+    format_rows = time.perf_counter() - start
+
+    print('formatting the {0} rows of the report once: {1:.3f}s'.format(light_num,format_rows))
+    print('{0:>10} {1:>14} {2:>14} {3:>10}'.format('rows/page','to_html[ms]','rows[ms]','speedup'))
+
+    for num_rows in rows_per_page:
+        pages = range(0, min(light_num, repeat*num_rows), num_rows)
+
+        start = time.perf_counter()
+        for row in pages:
+            page = { 'page_no': 1, 'm_table': mtab_df.iloc[row:row+num_rows].to_html(index=True), 'plot_path': 'plot.png' }
+            template.render(pages=[page], **context)
+        before = (time.perf_counter() - start) / len(pages)
+
+        start = time.perf_counter()
+        for row in pages:
+            page = { 'page_no': 1, 'm_table': QtPDF.tableHTML(mtab_df, rows[row:row+num_rows]), 'plot_path': 'plot.png' }
+            template.render(pages=[page], **context)
+        after = (time.perf_counter() - start) / len(pages)
+
+        print('{0:>10} {1:>14.2f} {2:>14.2f} {3:>9.1f}x'.format(num_rows,1000*before,1000*after,before/after))
+
+def benchStartup(runs=5):
+    import subprocess
+
+    #Each step runs in a fresh interpreter so that nothing is imported beforehand
+    steps = (
+                ('import QtPDF', 'import QtPDF'),
+                ('summary table', 'import QtPDF, QtIngest; QtPDF.summarize(QtIngest.readCSV("data/m_data.csv"))'),
+                ('rendering stack', 'import QtPDF, jinja2, PyPDF2, weasyprint, scipy.interpolate, scipy.spatial, matplotlib.figure, matplotlib.backends.backend_agg')
+            )
+
+    print('{0:>16} {1:>12}'.format('step','median[s]'))
+
+    for name, code in steps:
+
+        times = []
+        for run in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', 'import sys; sys.path.append("src"); ' + code], check=True)
+            times.append(time.perf_counter() - start)
+
+        print('{0:>16} {1:>12.3f}'.format(name,np.median(times)))
+
+#Stages of the pipeline benchmark, in the order they run
+PIPELINE_STAGES = ('summarize', 'grid', 'interpolate', 'contour', 'encode', 'html', 'pdf', 'merge', 'report')
+
+def benchPipeline(sizes=(10,100,1000,10000), seed=0):
+    #Run the whole report on inputgen data of each size and time its stages, returning
+    #{ light_num: { stage: seconds } }. summarize and grid run on their own; the other stages
+    #are summed over the pages of the report as timed by QtTiming
+    results = {}
+
+    #Import the rendering stack beforehand so that the first size is not charged for it
+    import jinja2, PyPDF2, weasyprint, scipy.interpolate, scipy.spatial, matplotlib.figure, matplotlib.backends.backend_agg
+
+    print('{0:>8}'.format('lights') + ''.join('{0:>12}'.format(stage) for stage in PIPELINE_STAGES) + '{0:>12}'.format('pages/s'))
+
+    for light_num in sizes:
+
+        df = inputgen.makeLights(light_num, seed)
+        index = QtPDF.QtLightIndex(df)
+
+        start = time.perf_counter()
+        QtPDF.summarize(df, index)
+        timings = { 'summarize': time.perf_counter() - start }
+
+        #Interpolate every light with a cold grid engine
+        start = time.perf_counter()
+        QtGrid.QtGridEngine().gridCube(*zip(*[ index.light(id) for id in index.ids ]))
+        timings['grid'] = time.perf_counter() - start
+
+        report = QtPDF.QtReport(df, report_file_name='benchmark-{0}'.format(light_num), agent_name='Benchmark', airport_name='Benchmark', way_name='Benchmark')
+
+        #Time every page and render it even if an earlier run left it in the page cache
+        report.timer = QtTiming.QtTimer()
+        report.pageCache = None
+
+        start = time.perf_counter()
+        report.generate()
+        timings['report'] = time.perf_counter() - start
+
+        summary = report.timer.summary()
+        for stage in PIPELINE_STAGES:
+            if stage not in timings:
+                timings[stage] = summary['stages'][stage]['wall'] if stage in summary['stages'] else 0.0
+
+        num_of_pages = len(summary['pages']) or 1
+        results[light_num] = timings
+
+        print('{0:>8}'.format(light_num) + ''.join('{0:>12.3f}'.format(timings[stage]) for stage in PIPELINE_STAGES) + '{0:>12.2f}'.format(num_of_pages/timings['report']))
+
+    return results
+
+def _reportPeak(light_num, dpi):
+    #Generate a report in this (fresh) process and return its peak memory in MiB and its number of pages
+    df = inputgen.makeLights(light_num, 0)
+
+    report = QtPDF.QtReport(df, report_file_name='benchmark-memory-{0}'.format(light_num), agent_name='Benchmark', airport_name='Benchmark', way_name='Benchmark')
+    report.pageCache = None
+    if dpi:
+        report.config['ContourFormat']['dpi'] = str(dpi)
+
+    try:
+        import resource
+    except ImportError:
+        #Without resource (Windows) only the memory allocated through Python is measured
+        import tracemalloc
+        tracemalloc.start()
+        report.generate()
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+    else:
+        report.generate()
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        #ru_maxrss is in KiB on Linux and in bytes on macOS
+        peak = peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+    return peak, int(np.ceil(len(report.mtab_df) / report.num_rows_per_page))
+
+def benchMemory(sizes=(1000,10000), dpi=None, ceiling=None, growth=1.5):
+    #Check that the peak memory of a report does not grow with its length: each size runs in a fresh
+    #process, the peak of the longest report may be at most growth times that of the shortest one
+    #and, if given, below ceiling MiB. Return the failed checks
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    print('{0:>8} {1:>8} {2:>12}'.format('lights','pages','peak[MiB]'))
+
+    peaks = []
+    for light_num in sizes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            peak, num_of_pages = executor.submit(_reportPeak, light_num, dpi).result()
+
+        peaks.append(peak)
+        print('{0:>8} {1:>8} {2:>12.0f}'.format(light_num,num_of_pages,peak))
+
+    failed = []
+
+    if peaks[-1] > growth*peaks[0]:
+        failed.append('the peak grew {0:.2f}x from {1} to {2} lights'.format(peaks[-1]/peaks[0],sizes[0],sizes[-1]))
+    if ceiling is not None and max(peaks) > ceiling:
+        failed.append('the peak of {0:.0f} MiB is above the ceiling of {1:.0f} MiB'.format(max(peaks),ceiling))
+
+    for failure in failed:
+        print('Memory check failed: ' + failure)
+
+    return failed
+
+def environment():
+    #What the timings of a baseline depend on besides the code
+    import matplotlib
+    import scipy
+    import QtConfigure
+
+    config = QtConfigure.getConfig()
+
+    return {
+                'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'numpy': np.__version__,
+                'pandas': pd.__version__,
+                'scipy': scipy.__version__,
+                'matplotlib': matplotlib.__version__,
+                'config': { section: dict(config[section]) for section in ('ReportFormat', 'ContourFormat') }
+           }
+
+def saveBaseline(results, path, seed=0):
+
+    baseline = { 'environment': environment(), 'seed': seed, 'results': { str(light_num): timings for light_num, timings in results.items() } }
+
+    with open(path, 'w') as baseline_file:
+        json.dump(baseline, baseline_file, indent=2)
+
+    print('Saved the baseline to {0}'.format(path))
+
+def compareBaseline(results, path, tolerance=1.2):
+    #Compare the timings with a saved baseline and return the stages slower than tolerance times their baseline
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = []
+
+    print('{0:>8} {1:>12} {2:>12} {3:>12} {4:>8}'.format('lights','stage','baseline[s]','now[s]','ratio'))
+
+    for light_num, timings in results.items():
+
+        before = baseline['results'].get(str(light_num))
+        if before is None:
+            continue
+
+        for stage in PIPELINE_STAGES:
+            #Stages this short are mostly noise
+            if before.get(stage, 0.0) < 0.01:
+                continue
+
+            ratio = timings[stage] / before[stage]
+            flag = ''
+
+            if ratio > tolerance:
+                regressions.append((light_num, stage, ratio))
+                flag = ' slower'
+
+            print('{0:>8} {1:>12} {2:>12.3f} {3:>12.3f} {4:>7.2f}x{5}'.format(light_num,stage,before[stage],timings[stage],ratio,flag))
+
+    return regressions
+
+if __name__ == '__main__':
+
+    benches = ('transform', 'grid', 'compliance', 'contour', 'tri', 'html', 'startup', 'pipeline', 'memory')
+
+    parser = argparse.ArgumentParser(description='Benchmark the stages of the report')
+    parser.add_argument('benches', nargs='*', choices=benches, default=['transform', 'grid', 'contour', 'startup'], help='benchmarks to run (transform, grid, contour and startup by default)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10,100,1000,10000], help='numbers of lights of the pipeline benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data of the pipeline benchmark')
+    parser.add_argument('--baseline', default='benchmark-baseline.json', help='baseline the pipeline timings are compared with')
+    parser.add_argument('--save', action='store_true', help='save the pipeline timings as the new baseline instead')
+    parser.add_argument('--memory-sizes', type=int, nargs='+', default=[1000,10000], help='numbers of lights of the memory check, shortest report first')
+    parser.add_argument('--memory-ceiling', type=float, default=None, help='peak memory in MiB no report of the memory check may exceed')
+    parser.add_argument('--dpi', type=int, default=None, help='resolution of the plots of the memory check (the configured one by default)')
+    parser.add_argument('--tolerance', type=float, default=1.2, help='ratio to the baseline above which a stage counts as a regression')
+    args = parser.parse_args()
+
+    if 'transform' in args.benches:
+        benchTransform()
+    if 'grid' in args.benches:
+        benchGrid()
+    if 'compliance' in args.benches:
+        benchCompliance()
+    if 'contour' in args.benches:
+        benchContourFormats()
+    if 'tri' in args.benches:
+        benchTri()
+    if 'html' in args.benches:
+        benchHTML()
+    if 'startup' in args.benches:
+        benchStartup()
+
+    if 'memory' in args.benches:
+        if benchMemory(args.memory_sizes, args.dpi, args.memory_ceiling):
+            sys.exit(1)
+
+    if 'pipeline' in args.benches:
+        results = benchPipeline(args.sizes, args.seed)
+
+        if args.save:
+            saveBaseline(results, args.baseline, args.seed)
+        elif os.path.exists(args.baseline):
+            if compareBaseline(results, args.baseline, args.tolerance):
+                sys.exit(1)
+        else:
+            print('No baseline at {0}; run again with --save to keep these timings'.format(args.baseline))
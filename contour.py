@@ -1,12 +1,24 @@
-from matplotlib.tri.triangulation import Triangulation
-import numpy as np
+import sys
+import os
 import pandas as pd
 import matplotlib
-from matplotlib import tri as tri
 from matplotlib import pyplot as plt
-from scipy.interpolate import griddata
 from scipy.stats import gaussian_kde
 
+curDir = os.path.abspath(os.getcwd())
+srcDir = os.path.join(curDir,'src')
+sys.path.append(curDir)
+sys.path.append(srcDir)
+
+import QtGrid
+
+#Triangulations of the sampling layouts seen so far by grid()
+grid_engine = QtGrid.QtGridEngine()
+
+#Refined triangulations of the sampling layouts seen so far by tricontour(), leaving out the
+#triangles centred within 0.1 degrees of the axis
+tri_engine = QtGrid.QtTriEngine(min_radius=0.10)
+
 def scatter():
 
     #read in data from the csv file
@@ -45,13 +57,8 @@ def scatter():
     plt.show()
 
 def grid(x, y, z, resX=100, resY=100):
-
-    xi = np.linspace(min(x), max(x), resX)
-    yi = np.linspace(min(y), max(y), resY)
-    X, Y = np.meshgrid(xi, yi)
-    Z =  griddata((x, y) , z ,  (xi[None,:], yi[:,None]) ,method='cubic'   )
     
-    return X, Y, Z
+    return grid_engine.grid(x, y, z, resX, resY)
 
 def contour():
     #read in data from the csv file
@@ -112,12 +119,8 @@ def tricontour():
     for i in range(2):
         for j in range(2):
 
-            triang = Triangulation(H,V)
-            triang.set_mask(np.hypot(H[triang.triangles].mean(axis=1),
-                         V[triang.triangles].mean(axis=1))< 0.10)
-    
-            refiner = tri.UniformTriRefiner(triang)
-            triang_refi, I_refi = refiner.refine_field(I, subdiv=3)
+            #The layout is triangulated and refined once, only the intensities are refined again
+            triang_refi, I_refi = tri_engine.refine(H, V, I, subdiv=3)
 
             tricon = ax[i,j].tricontour(triang_refi, I_refi,levels=15, linewidths=0.5, colors='k')
             triconf =ax[i,j].tricontourf(triang_refi,I_refi,levels=15, cmap='Spectral_r',vmin=0 , vmax=maxI)
@@ -1,4 +1,6 @@
+import os
 import random
+import argparse
 import datetime
 import pandas as pd
 import numpy as np
@@ -11,62 +13,185 @@ def random_date():
 max_sensor_num = 8
 max_measurement_num = 7
 
-light_num = int(input('Enter the number of light sources to simulate: '))
-
-print('Generating {0} light sources...\n'.format(light_num))
-
 columns =('Light ID','%ICAO','I','H','V','C','S')
 
 possible_colors   =['G', 'W', 'R', 'Y']
 possible_outcomes =['P', 'F']
 
-light_ids   = []
-ICAOs = []
-colors = []
-outcomes = []
-
-Is = []
-Hs = []
-Vs = []
-
-df = pd.read_csv('data/raw_data.csv')
-Ii = df['Intensity'].tolist()
-Hi = df['H'].tolist()
-Vi = df['V'].tolist()
-
-for i in range(0,light_num):
-
-    ICAO = random.uniform(40,200)
-    color = np.random.choice(possible_colors,p=[0.25,0.25,0.25,0.25])
-    outcome = np.random.choice(possible_outcomes,p=[0.55,0.45])
-    
-    for j in range(0,max_sensor_num):
-        for k in range(0,max_measurement_num):
-
-            light_ids.append(i+1)
-            ICAOs.append(ICAO)
-            colors.append(color)
-            outcomes.append(outcome)
-
-            Is.append(Ii[j*max_measurement_num+k]+random.uniform(0,50))
-            Hs.append(Hi[j*max_measurement_num+k]+random.uniform(-1.0,1.0))
-            Vs.append(Vi[j*max_measurement_num+k]+random.uniform(-1.0,1.0))
-            
-#assemble columns 
-data = {    
-            columns[0]:light_ids,
-            columns[1]:ICAOs,
-            columns[2]:Is,
-            columns[3]:Hs,
-            columns[4]:Vs,
-            columns[5]:colors,
-            columns[6]:outcomes
-       }
-
-#construct data frame
-df = pd.DataFrame(data,columns=columns)
-pd.options.display.max_rows = light_num*max_measurement_num*max_sensor_num
-
-#save data frame tp .csv file
-df.to_csv('data/m_data.csv',float_format='%.2f')            
-            
+#Formats the simulated measurements can be written in
+OUTPUT_FORMATS = ('csv', 'npy')
+
+#Record of one measurement in a .npy file
+RECORD = np.dtype([
+                    ('Light ID', np.int64),
+                    ('%ICAO', np.float32),
+                    ('I', np.float32),
+                    ('H', np.float32),
+                    ('V', np.float32),
+                    ('C', 'U1'),
+                    ('S', 'U1')
+                  ])
+
+def iterLights(light_num, seed=None, *, sensor_num=max_sensor_num, measurement_num=max_measurement_num, lights_per_chunk=100000, raw_data='data/raw_data.csv'):
+    #Synthesize light_num light sources around the reference scan in raw_data, yielding data frames
+    #of lights_per_chunk light sources. Each light source is measured sensor_num*measurement_num
+    #times, cycling through the points of the reference scan. The same seed and chunk size always
+    #give the same measurements
+    rng = np.random.default_rng(seed)
+
+    raw_df = pd.read_csv(raw_data)
+    num_points = sensor_num*measurement_num
+
+    reference = np.arange(num_points) % len(raw_df)
+    Ii = raw_df['Intensity'].values[reference]
+    Hi = raw_df['H'].values[reference]
+    Vi = raw_df['V'].values[reference]
+
+    for first in range(0, light_num, lights_per_chunk):
+        num_lights = min(lights_per_chunk, light_num-first)
+        num_rows = num_lights*num_points
+
+        data = {
+                    columns[0]: np.repeat(np.arange(first+1, first+num_lights+1), num_points),
+                    columns[1]: np.repeat(rng.uniform(40,200,num_lights), num_points),
+                    columns[2]: np.tile(Ii,num_lights) + rng.uniform(0,50,num_rows),
+                    columns[3]: np.tile(Hi,num_lights) + rng.uniform(-1.0,1.0,num_rows),
+                    columns[4]: np.tile(Vi,num_lights) + rng.uniform(-1.0,1.0,num_rows),
+                    columns[5]: pd.Categorical.from_codes(np.repeat(rng.choice(len(possible_colors),num_lights,p=[0.25,0.25,0.25,0.25]), num_points), possible_colors),
+                    columns[6]: pd.Categorical.from_codes(np.repeat(rng.choice(len(possible_outcomes),num_lights,p=[0.55,0.45]), num_points), possible_outcomes)
+               }
+
+        df = pd.DataFrame(data,columns=columns)
+        #Number the rows across chunks as if the frame had been built at once
+        df.index = pd.RangeIndex(first*num_points, first*num_points+num_rows)
+
+        yield df
+
+def makeLights(light_num, seed=None, **kwargs):
+    #Synthesize all the light sources at once; takes the options of iterLights
+    return pd.concat(iterLights(light_num, seed, **kwargs))
+
+def _fixedPoint(values, decimals, end):
+    #Format a whole column of numbers with the given number of decimals, followed by the end byte,
+    #as rows of ASCII bytes together with a mask of the bytes in use, instead of formatting each value
+    scaled = np.rint(np.asarray(values, dtype=np.float64) * 10**decimals).astype(np.int64)
+    negative = scaled < 0
+    scaled = np.abs(scaled)
+
+    width = max(len(str(scaled.max())), decimals+1)
+    size = 1 + width + (1 if decimals > 0 else 0) + 1
+
+    chars = np.empty((len(scaled), size), dtype=np.uint8)
+    mask = np.ones((len(scaled), size), dtype=bool)
+
+    chars[:,0] = ord('-')
+    mask[:,0] = negative
+    chars[:,-1] = ord(end)
+
+    #Write the digits from the last one on, dropping the leading zeros but the one before the decimal point
+    column = size - 2
+    for position in range(width):
+        if decimals > 0 and position == decimals:
+            chars[:,column] = ord('.')
+            column = column - 1
+
+        chars[:,column] = scaled % 10 + ord('0')
+        if position > decimals:
+            mask[:,column] = scaled > 0
+
+        scaled = scaled // 10
+        column = column - 1
+
+    return chars, mask
+
+def _writeCSV(df, output_file, rows_per_block=1 << 20):
+    #Write the rows of a frame of simulated measurements like df.to_csv(float_format='%.2f'),
+    #but for rounding to zero from below, which is written 0.00 rather than -0.00
+    for start in range(0, len(df), rows_per_block):
+        block = df.iloc[start:start+rows_per_block]
+
+        fields = [ _fixedPoint(block.index.values, 0, ','), _fixedPoint(block[columns[0]].values, 0, ',') ]
+
+        for column in columns[1:5]:
+            fields.append(_fixedPoint(block[column].values, 2, ','))
+
+        for column, end in zip(columns[5:], (',', '\n')):
+            #The colors and outcomes are single letters
+            letters = np.frombuffer(np.asarray(block[column].cat.categories, dtype='S1').tobytes(), dtype=np.uint8)
+
+            chars = np.full((len(block),2), ord(end), dtype=np.uint8)
+            chars[:,0] = letters[block[column].cat.codes.values]
+            fields.append((chars, np.ones((len(block),2), dtype=bool)))
+
+        chars = np.hstack([ field[0] for field in fields ])
+        mask = np.hstack([ field[1] for field in fields ])
+
+        output_file.write(chars[mask].tobytes())
+
+    return
+
+def writeLights(chunks, path, output_format=None, num_rows=None):
+    #Write a data frame or the chunks of iterLights one after another to a .csv file,
+    #or to a .npy file of RECORDs, which also needs the total number of rows up front
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
+        num_rows = len(chunks[0])
+
+    if output_format is None:
+        output_format = os.path.splitext(path)[1].lstrip('.').lower()
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError('The output format must be one of {0}, not {1}'.format(', '.join(OUTPUT_FORMATS), output_format))
+
+    if output_format == 'csv':
+        with open(path, 'wb') as output_file:
+            output_file.write((',' + ','.join(columns) + '\n').encode('utf-8'))
+
+            for df in chunks:
+                _writeCSV(df, output_file)
+    else:
+        records = np.lib.format.open_memmap(path, mode='w+', dtype=RECORD, shape=(num_rows,))
+
+        row = 0
+        for df in chunks:
+            chunk = records[row:row+len(df)]
+            for column in columns:
+                values = df[column]
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    chunk[column] = np.asarray(values.cat.categories)[values.cat.codes.values]
+                else:
+                    #Keep the precision of the .csv files
+                    chunk[column] = np.round(values.values, 2)
+            row = row + len(df)
+
+        records.flush()
+        del records
+
+    return
+
+def readLights(path):
+    #Read the measurements written by writeLights back into a data frame
+    if path.lower().endswith('.npy'):
+        records = np.load(path, mmap_mode='r')
+        return pd.DataFrame({ column: records[column] for column in columns }, columns=columns)
+
+    return pd.read_csv(path, index_col=0)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Simulate the measurements of a number of light sources')
+    parser.add_argument('light_num', type=int, help='number of light sources to simulate')
+    parser.add_argument('output', help='.csv or .npy file to write, e.g. data/m_data.csv')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random measurements, for reproducible files')
+    parser.add_argument('--sensors', type=int, default=max_sensor_num, help='number of sensors measuring each light source')
+    parser.add_argument('--measurements', type=int, default=max_measurement_num, help='number of measurements of each sensor')
+    parser.add_argument('--chunk', type=int, default=100000, help='number of light sources generated and written at a time')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None, help='output format (taken from the extension of output by default)')
+    parser.add_argument('--raw-data', default='data/raw_data.csv', help='reference scan the light sources are simulated around')
+    args = parser.parse_args()
+
+    print('Generating {0} light sources...\n'.format(args.light_num))
+
+    chunks = iterLights(args.light_num, args.seed, sensor_num=args.sensors, measurement_num=args.measurements, lights_per_chunk=args.chunk, raw_data=args.raw_data)
+
+    writeLights(chunks, args.output, args.format, args.light_num*args.sensors*args.measurements)
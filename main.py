@@ -1,6 +1,5 @@
 import sys
 import os
-import pandas as pd
 
 curDir = os.path.abspath(os.getcwd())
 srcDir = os.path.join(curDir,'src')
@@ -18,8 +17,9 @@ def main():
                     'agent_name':'FBT_Sp'
     }
 
-    df = pd.read_csv('data/m_data.csv')
-    report = QtPDF.QtReport(df,**headerData)
+    #The measurement file is read at once or streamed depending on [DataFrame] in QtConfig.ini
+    report = QtPDF.QtReport('data/m_data.csv',**headerData)
     report.generate()
 
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import os
+import csv
+import json
+import time
+import logging
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+#Fields of a job in a manifest
+HEADER_FIELDS = ('report_file_name', 'airport_name', 'way_name', 'agent_name')
+JOB_FIELDS = ('input',) + HEADER_FIELDS
+
+logger = logging.getLogger('QtBatch')
+
+def readManifest(path):
+    #A manifest is a CSV file with one job per row, or a JSON list of jobs (optionally under "jobs")
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == '.json':
+        with open(path, encoding='utf-8') as manifest_file:
+            jobs = json.load(manifest_file)
+        if isinstance(jobs, dict):
+            jobs = jobs['jobs']
+    elif extension == '.csv':
+        with open(path, newline='', encoding='utf-8') as manifest_file:
+            jobs = list(csv.DictReader(manifest_file))
+    else:
+        raise ValueError('{0} is not a .csv or .json manifest'.format(path))
+
+    for job_no, job in enumerate(jobs, 1):
+        missing = [ field for field in JOB_FIELDS if not job.get(field) ]
+        if missing:
+            raise ValueError('Job {0} of {1} is missing {2}'.format(job_no, path, ', '.join(missing)))
+
+    return [ { field: job[field] for field in JOB_FIELDS } for job in jobs ]
+
+def _initWorker():
+    #Import the rendering stack once per worker process rather than once per report. QtPDF
+    #only imports the libraries that render the pages when a page is rendered, so they are
+    #imported here by name.
+    import QtPDF
+    import jinja2
+    import weasyprint
+    import PyPDF2
+    import contourpy
+    import scipy.spatial
+    import scipy.interpolate
+    import matplotlib.figure
+    import matplotlib.backends.backend_agg
+
+def runJob(job):
+    import QtPDF
+
+    start = time.perf_counter()
+
+    report = QtPDF.QtReport( job['input'] , **{ field: job[field] for field in HEADER_FIELDS } )
+
+    #The batch already keeps every worker busy, so the pages of a report are rendered in its worker
+    report.config['ReportFormat']['numberofworkers'] = '1'
+    report.generate()
+
+    return time.perf_counter() - start
+
+def runBatch(jobs, *, workers=None, keep_going=False, log_file='batch.log'):
+    #Generate the reports of jobs with a bounded pool of worker processes and return the failed jobs.
+    #Only as many jobs as there are workers are handed to the pool at a time, so that unless
+    #keep_going is set no job is started after the first failure.
+    handlers = [ logging.StreamHandler() ]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    workers = workers or os.cpu_count()
+    failed = []
+    done = 0
+    start = time.perf_counter()
+
+    try:
+        logger.info('Starting {0} reports on {1} workers'.format(len(jobs), workers))
+
+        with ProcessPoolExecutor( max_workers=workers , initializer=_initWorker ) as executor:
+
+            waiting = iter(jobs)
+            running = {}
+            stopped = False
+
+            while True:
+                #Keep one job per worker in the pool, none once stopped
+                while not stopped and len(running) < workers:
+                    job = next(waiting, None)
+                    if job is None:
+                        break
+                    running[executor.submit(runJob, job)] = job
+
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in finished:
+                    job = running.pop(future)
+                    done = done + 1
+
+                    try:
+                        elapsed = future.result()
+                    except Exception:
+                        failed.append(job)
+                        logger.error('[{0}/{1}] {2} failed:\n{3}'.format(done, len(jobs), job['report_file_name'], traceback.format_exc()))
+
+                        if not keep_going and not stopped:
+                            #Let the running reports finish but start no new ones
+                            stopped = True
+                            logger.info('Stopping after the reports already running')
+                    else:
+                        logger.info('[{0}/{1}] {2} done in {3:.1f}s'.format(done, len(jobs), job['report_file_name'], elapsed))
+
+            not_run = list(waiting)
+
+        elapsed = time.perf_counter() - start
+        logger.info('{0} of {1} reports done in {2:.1f}s ({3:.1f} reports per minute), {4} failed, {5} not run'.format(done-len(failed), len(jobs), elapsed, 60*(done-len(failed))/elapsed, len(failed), len(not_run)))
+
+        if not_run:
+            logger.info('Not run: {0}'.format(', '.join( job['report_file_name'] for job in not_run )))
+    finally:
+        for handler in handlers:
+            logger.removeHandler(handler)
+            handler.close()
+
+    return failed
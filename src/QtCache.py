@@ -0,0 +1,253 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+import QtIngest
+
+#Bump whenever the layout of a cache entry or the way its values are computed changes
+CACHE_VERSION = 4
+
+#Arrays making up a QtLightIndex
+INDEX_ARRAYS = ('order', 'ids', 'counts', 'offsets', 'H', 'V', 'I')
+
+def fingerprint(*parts):
+    #Hash arrays by their content and everything else by its repr
+    digest = hashlib.sha256()
+    digest.update(str(CACHE_VERSION).encode('utf-8'))
+
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(repr(part).encode('utf-8'))
+        digest.update(b'|')
+
+    return digest.hexdigest()
+
+def writeColumns(folder, columns):
+    #Write each column as its own .npy file and describe how to rebuild it
+    meta = {}
+    for name, (file_name, values) in columns.items():
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(folder, file_name), values.cat.codes.values)
+            meta[name] = { 'file': file_name, 'categories': values.cat.categories.tolist() }
+        else:
+            values = np.asarray(values)
+            if values.dtype == object:
+                values = values.astype(str)
+            np.save(os.path.join(folder, file_name), values)
+            meta[name] = { 'file': file_name }
+    return meta
+
+def readColumns(folder, meta):
+    #Memory-map the columns written by writeColumns
+    columns = {}
+    for name, entry in meta.items():
+        values = np.load(os.path.join(folder, entry['file'] + '.npy'), mmap_mode='r')
+        if 'categories' in entry:
+            values = pd.Categorical.from_codes(values, entry['categories'])
+        columns[name] = values
+    return columns
+
+class QtCache:
+
+    def __init__(self , location ):
+        self.location = location
+
+        if not os.path.exists(self.location):
+            os.makedirs(self.location)
+
+    def key( self , path , schema=None , *settings ):
+        #Hash the content of the measurement file together with everything that shapes its parsed form
+        #and its summary table
+        digest = hashlib.sha256()
+        digest.update('{0}|{1}|{2!r}|{3!r}'.format(CACHE_VERSION, QtIngest.DTYPES, schema or QtIngest.QtSchema(), settings).encode('utf-8'))
+
+        with open(path, 'rb') as data_file:
+            for block in iter(lambda: data_file.read(1 << 20), b''):
+                digest.update(block)
+
+        return digest.hexdigest()
+
+    def store( self , key , index , mtab_df , gminI , gmaxI ):
+
+        target = os.path.join(self.location, key)
+        if os.path.exists(target):
+            return
+
+        #Write into a private folder first so that readers never see a partial entry
+        staging = '{0}.{1}.tmp'.format(target, os.getpid())
+        os.makedirs(staging)
+
+        summary = { 'Light ID': ('summary-id', mtab_df.index) }
+        for n, name in enumerate(mtab_df.columns):
+            summary[name] = ('summary-{0}'.format(n), mtab_df[name])
+
+        meta = {
+                    'version': CACHE_VERSION,
+                    'range': [float(gminI), float(gmaxI)],
+                    'summary': writeColumns(staging, summary),
+                    'columns': list(mtab_df.columns),
+                    'index': None
+               }
+
+        if index is not None:
+            arrays = { name: ('index-{0}'.format(name), getattr(index, name)) for name in INDEX_ARRAYS }
+            meta['index'] = writeColumns(staging, arrays)
+
+        with open(os.path.join(staging, 'meta.json'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+        try:
+            os.replace(staging, target)
+        except OSError:
+            #Another report stored the same entry in the meantime
+            shutil.rmtree(staging, ignore_errors=True)
+
+        return
+
+    def load( self , key ):
+        #Return the memory-mapped arrays of the light index (None if they were not stored), the summary table
+        #and the global intensity range, or None if the file has not been seen before
+        folder = os.path.join(self.location, key)
+
+        try:
+            with open(os.path.join(folder, 'meta.json')) as meta_file:
+                meta = json.load(meta_file)
+        except OSError:
+            return None
+
+        if meta.get('version') != CACHE_VERSION:
+            return None
+
+        #The modification time of an entry is when it was last used, which is what prune goes by
+        try:
+            os.utime(folder)
+        except OSError:
+            pass
+
+        summary = readColumns(folder, meta['summary'])
+        ids = summary.pop('Light ID')
+
+        mtab_df = pd.DataFrame(summary, columns=meta['columns'], index=pd.Index(np.array(ids), name='Light ID'))
+
+        index = None
+        if meta['index'] is not None:
+            index = readColumns(folder, meta['index'])
+
+        gminI, gmaxI = meta['range']
+
+        return index, mtab_df, (gminI, gmaxI)
+
+    def prune( self , max_bytes ):
+        #Remove the entries of other cache versions, which are never loaded, then the entries used
+        #longest ago until the rest take up at most max_bytes
+        entries = []
+        for name in os.listdir(self.location):
+            folder = os.path.join(self.location, name)
+
+            #Entries still being written are staged under a name of their own, and other caches
+            #sharing the location have no meta.json
+            if name.endswith('.tmp'):
+                continue
+
+            try:
+                with open(os.path.join(folder, 'meta.json')) as meta_file:
+                    version = json.load(meta_file).get('version')
+
+                mtime = os.stat(folder).st_mtime
+                size = sum( entry.stat().st_size for entry in os.scandir(folder) if entry.is_file() )
+            except (OSError, ValueError):
+                continue
+
+            if version != CACHE_VERSION:
+                shutil.rmtree(folder, ignore_errors=True)
+                continue
+
+            entries.append((mtime, size, name))
+
+        entries.sort(reverse=True)
+
+        kept = 0
+        for mtime, size, name in entries:
+            kept += size
+            if kept <= max_bytes:
+                continue
+
+            #An entry still memory-mapped by another report may not be removable yet
+            shutil.rmtree(os.path.join(self.location, name), ignore_errors=True)
+
+        return
+
+class QtPageCache:
+
+    def __init__(self , location ):
+        self.location = location
+
+        if not os.path.exists(self.location):
+            os.makedirs(self.location)
+
+    def get( self , fingerprint , extension ):
+        #Return a stored artefact as bytes, or None if there is none
+        stored = os.path.join(self.location, fingerprint + extension)
+        try:
+            with open(stored, 'rb') as stored_file:
+                data = stored_file.read()
+        except FileNotFoundError:
+            return None
+
+        #The modification time of an artefact is when it was last used, which is what prune goes by
+        try:
+            os.utime(stored)
+        except FileNotFoundError:
+            pass
+
+        return data
+
+    def put( self , fingerprint , extension , data ):
+
+        stored = os.path.join(self.location, fingerprint + extension)
+        if os.path.exists(stored):
+            return
+
+        #Write under a private name first so that readers never see a partial artefact
+        staging = '{0}.{1}.tmp'.format(stored, os.getpid())
+
+        with open(staging, 'wb') as staging_file:
+            staging_file.write(data)
+
+        os.replace(staging, stored)
+
+        return
+
+    def prune( self , max_bytes ):
+        #Remove the artefacts used longest ago until the rest take up at most max_bytes
+        entries = []
+        for name in os.listdir(self.location):
+            #Artefacts still being written are staged under a name of their own
+            if name.endswith('.tmp'):
+                continue
+
+            try:
+                stat = os.stat(os.path.join(self.location, name))
+            except FileNotFoundError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        entries.sort(reverse=True)
+
+        kept = 0
+        for mtime, size, name in entries:
+            kept += size
+            if kept <= max_bytes:
+                continue
+
+            try:
+                os.remove(os.path.join(self.location, name))
+            except FileNotFoundError:
+                pass
+
+        return
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+class QtCompliance:
+
+    def __init__(self , minimum_intensity , thresholds=(50,100) , ellipse=(10.0,5.0) , centre=(0.0,0.0) , ellipse_ratio=50.0 ):
+        #Check the intensity grids of the lights against the minimum average intensity of the ICAO
+        #isocandela diagram of the kind of light surveyed, in candela:
+        #   A<t>%   area in square degrees where the intensity reaches t% of the minimum
+        #   Offset  distance in degrees from (0,0) to the intensity-weighted centroid of the beam
+        #   Emin    least intensity measured inside the ellipse with the given semi-axes and centre
+        #   Ellipse P if Emin reaches ellipse_ratio% of the minimum, F otherwise
+        if minimum_intensity <= 0:
+            raise ValueError('The minimum intensity must be positive, not {0}'.format(minimum_intensity))
+
+        if len(ellipse) != 2 or min(ellipse) <= 0:
+            raise ValueError('The ellipse must be given by two positive semi-axes, not {0}'.format(', '.join(map(str, ellipse))))
+
+        if len(centre) != 2:
+            raise ValueError('The centre of the ellipse must be given by two angles, not {0}'.format(', '.join(map(str, centre))))
+
+        self.minimumIntensity = float(minimum_intensity)
+        self.thresholds = tuple( float(threshold) for threshold in thresholds )
+        self.ellipse = tuple( float(axis) for axis in ellipse )
+        self.centre = tuple( float(angle) for angle in centre )
+        self.ellipseRatio = float(ellipse_ratio)
+
+    @classmethod
+    def fromConfig( cls , config ):
+        #Read the checks from [Compliance], or None unless they are enabled there
+        if not config.getboolean('Compliance', 'enabled', fallback=False):
+            return None
+
+        section = config['Compliance']
+
+        def numbers(option, fallback):
+            value = section.get(option, fallback=fallback)
+            try:
+                return [ float(number) for number in value.split(',') if number.strip() ]
+            except ValueError:
+                raise ValueError('Compliance.{0} must be a list of numbers separated by commas, not {1}'.format(option, value)) from None
+
+        return cls( section.getfloat('minimumintensity', fallback=10000.0) ,
+                    numbers('thresholds', '50, 100') ,
+                    numbers('ellipse', '10, 5') ,
+                    numbers('ellipsecentre', '0, 0') ,
+                    section.getfloat('ellipseratio', fallback=50.0) )
+
+    def columns( self ):
+        return tuple( 'A{0:g}%'.format(threshold) for threshold in self.thresholds ) + ('Offset', 'Emin', 'Ellipse')
+
+    def check( self , XI , YI , Z ):
+        #Compute the checks of all the lights of a cube from QtGridEngine.gridCube at once, with XI
+        #and YI the uniform grid axes of each light and Z its intensities, NaN outside its samples
+        measured = ~np.isnan(Z)
+
+        #Every grid cell stands for the same area of its light
+        cell = (XI[:,1] - XI[:,0]) * (YI[:,1] - YI[:,0])
+
+        data = {}
+
+        for column, threshold in zip(self.columns(), self.thresholds):
+            with np.errstate(invalid='ignore'):
+                data[column] = np.count_nonzero(Z >= threshold/100*self.minimumIntensity, axis=(1,2)) * cell
+
+        #The cubic interpolation may dip below zero between samples, which carries no light
+        W = np.where(measured, np.maximum(Z, 0.0), 0.0)
+        total = W.sum(axis=(1,2))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            Hc = np.einsum('nyx,nx->n', W, XI) / total
+            Vc = np.einsum('nyx,ny->n', W, YI) / total
+
+        data['Offset'] = np.hypot(Hc, Vc)
+
+        #Cells of each grid inside the ellipse; the part of the ellipse that was not measured is left out
+        a, b = self.ellipse
+        h, v = self.centre
+        inside = ((XI[:,None,:]-h)/a)**2 + ((YI[:,:,None]-v)/b)**2 <= 1.0
+
+        #Clamped at zero like the centroid, as no light measures a negative intensity
+        Emin = np.min(np.where(inside & measured, np.maximum(Z, 0.0), np.inf), axis=(1,2))
+        Emin[np.isinf(Emin)] = np.nan
+        data['Emin'] = Emin
+
+        with np.errstate(invalid='ignore'):
+            passed = Emin >= self.ellipseRatio/100*self.minimumIntensity
+
+        data['Ellipse'] = pd.Categorical.from_codes(passed.astype(np.int8), ['F', 'P'])
+
+        return data
+
+    def checkLights( self , index , engine=None , lights_per_batch=500 , resX=100 , resY=100 ):
+        #Check every light of a QtLightIndex, interpolating the grids of lights_per_batch of them
+        #at a time with engine so that only one batch of grids is held in memory. By default each
+        #light is interpolated linearly on its own samples, so no light borrows another's layout
+        if engine is None:
+            import QtGrid
+            engine = QtGrid.QtLinearEngine()
+
+        Z = None
+        tables = []
+
+        for first in range(0, len(index), lights_per_batch):
+            ids = index.ids[first:first+lights_per_batch]
+
+            if Z is None or len(Z) != len(ids):
+                Z = np.empty((len(ids), resY, resX))
+
+            H, V, I = zip(*[ index.light(id) for id in ids ])
+            XI, YI, Z = engine.gridCube(H, V, I, resX, resY, out=Z)
+
+            tables.append(pd.DataFrame(self.check(XI, YI, Z), index=pd.Index(ids, name='Light ID'), columns=self.columns()))
+
+        if not tables:
+            return pd.DataFrame(columns=self.columns(), index=pd.Index([], name='Light ID'))
+
+        table = pd.concat(tables)
+        table['Ellipse'] = table['Ellipse'].astype(pd.CategoricalDtype(['F', 'P']))
+
+        return table
+
+    def __repr__( self ):
+        return 'QtCompliance({0!r}, {1!r}, ellipse={2!r}, centre={3!r}, ellipse_ratio={4!r})'.format(self.minimumIntensity, self.thresholds, self.ellipse, self.centre, self.ellipseRatio)
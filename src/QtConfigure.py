@@ -10,6 +10,8 @@ class QtConfig:
                         'tmp':'tmp',
                         'report':'report',
                         'templates':'templates',
+                        'cache':'cache',
+                        'surveys':'surveys',
                      } 
 
     def __initPaths(self):
@@ -43,6 +45,8 @@ class QtConfig:
             tmp_folder = os.path.join(QtUtils.getPath(self.rootPath), QtConfig.__directories['tmp'])
             report_folder = os.path.join(QtUtils.getPath(self.rootPath), QtConfig.__directories['report'])
             template_folder = os.path.join(QtUtils.getPath(self.rootPath), QtConfig.__directories['templates'])
+            cache_folder = os.path.join(QtUtils.getPath(self.rootPath), QtConfig.__directories['cache'])
+            survey_folder = os.path.join(QtUtils.getPath(self.rootPath), QtConfig.__directories['surveys'])
 
             #Define sections in the config file
             config['Locations'] = {
@@ -51,10 +55,24 @@ class QtConfig:
                                 'tempLocation':  tmp_folder,
                                 'reportLocation': report_folder,
                                 'templateLocation': template_folder,
+                                'cacheLocation': cache_folder,
+                                'surveyLocation': survey_folder,
                             }
-            config['DataFrame']    = {'indexColumn':'LightID'}
-            config['ReportFormat'] = {'numberOfRowsPerPage':15}
+            #cacheSize is the megabytes of parsed measurement files kept in the cache, the ones used longest ago going first
+            config['DataFrame']    = {'indexColumn':'LightID', 'streaming':'no', 'chunkSize':100000, 'cache':'yes', 'cacheSize':1024, 'sheet':'', 'headerRow':1}
+            #Headers of the measurement files naming a column differently, and values of the columns they lack
+            config['ColumnMapping'] = {}
+            config['ColumnDefaults'] = {}
+            #incrementalCacheSize is the megabytes of plots kept for incremental reports, the ones used longest ago going first
+            config['ReportFormat'] = {'numberOfRowsPerPage':15, 'numberOfWorkers':1, 'incremental':'no', 'incrementalCacheSize':256, 'debug':'no', 'singleDocument':'no'}
             config['BarChartFormat'] = {'widthOfOneBar':1.0}
+            #gridTolerance only applies to the contour plots: lights sampled within that many degrees of each other
+            #share one triangulation, so a light can be drawn on another light's sample positions. The compliance
+            #checks always interpolate each light on its own samples and are not affected by it
+            config['ContourFormat'] = {'nlevels':15, 'gridTolerance':0.0, 'dpi':400, 'imageFormat':'png', 'backend':'grid', 'subdiv':3}
+            config['Compliance'] = {'enabled':'no', 'minimumIntensity':10000, 'thresholds':'50, 100', 'ellipse':'10, 5', 'ellipseCentre':'0, 0', 'ellipseRatio':50}
+            config['Survey'] = {'store':'no', 'trendPage':'no', 'threshold':100, 'trendLights':15, 'trendSurveys':5}
+            config['Profiling'] = {'timing':'no', 'traceMemory':'no', 'timingFormat':'json', 'profilePage':0}
 
             with open('QtConfig.ini', 'w') as config_file:
                 config.write(config_file)
@@ -67,6 +85,25 @@ class QtConfig:
         #Initialize config file
         self.__createConfigFile()
 
+#The settings read by this process, by path of the config file
+_configs = {}
+
+def getConfig():
+    #Set up the folders and read QtConfig.ini only once per process; every caller gets its own copy
+    path = os.path.abspath('QtConfig.ini')
+
+    if path not in _configs:
+        QtConfig()
+
+        config = configparser.ConfigParser()
+        config.read(path)
+        _configs[path] = config
+
+    config = configparser.ConfigParser()
+    config.read_dict(_configs[path])
+
+    return config
+
 #Test QtConfig 
 if __name__ == '__main__':
     
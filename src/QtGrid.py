@@ -0,0 +1,373 @@
+from collections import OrderedDict
+import numpy as np
+
+class QtGridLayout:
+
+    def __init__(self , points , resX , resY ):
+
+        self.points = points
+        self.xi = np.linspace(points[:,0].min(), points[:,0].max(), resX)
+        self.yi = np.linspace(points[:,1].min(), points[:,1].max(), resY)
+
+        #The mesh is shared by every light source with this layout, so it must not be modified
+        self.X, self.Y = np.meshgrid(self.xi, self.yi)
+        self.X.flags.writeable = False
+        self.Y.flags.writeable = False
+
+        #Triangulate the sampling layout once
+        from scipy.spatial import Delaunay
+        self.triangulation = Delaunay(points)
+
+        #Weights mapping the intensities at the sampled points onto the grid, built on reuse
+        self.weights = None
+        self.uses = 0
+
+    def __cubic( self , values ):
+        #Same as scipy.interpolate.griddata(method='cubic') but without triangulating again
+        from scipy.interpolate import CloughTocher2DInterpolator
+        interpolator = CloughTocher2DInterpolator(self.triangulation, values)
+        return interpolator((self.xi[None,:], self.yi[:,None]))
+
+    def __buildWeights( self ):
+        #The cubic interpolant is linear in the intensities, so interpolating the unit vectors
+        #gives a matrix taking the intensities of any light source with this layout onto the grid
+        num_points = self.points.shape[0]
+        weights = self.__cubic(np.eye(num_points))
+        self.weights = np.ascontiguousarray(weights.reshape(-1, num_points))
+
+    def interpolate( self , values ):
+        #values holds the intensities of one light source per column
+        values = np.asarray(values, dtype=np.float64)
+        resY, resX = self.X.shape
+
+        self.uses = self.uses + (values.shape[1] if values.ndim > 1 else 1)
+
+        #Interpolate directly the first time a layout is seen, as building the weights costs more
+        if self.weights is None and self.uses < 2:
+            return self.__cubic(values)
+
+        if self.weights is None:
+            self.__buildWeights()
+
+        Z = self.weights @ values
+
+        return Z.reshape((resY, resX) + values.shape[1:])
+
+class QtGridEngine:
+
+    def __init__(self , tolerance=0.0 , max_layouts=64 ):
+        #Layouts whose coordinates differ by at most tolerance degrees count as equal
+        self.tolerance = tolerance
+        self.max_layouts = max_layouts
+        self.layouts = OrderedDict()
+
+    def __getstate__( self ):
+        #Triangulations are rebuilt on demand rather than sent between processes
+        state = self.__dict__.copy()
+        state['layouts'] = OrderedDict()
+        return state
+
+    def __find( self , points , params ):
+        #Look for a cached layout sampled at the same points, up to the tolerance
+        key = (params, points.shape, points.tobytes())
+
+        if key in self.layouts or self.tolerance <= 0:
+            return key
+
+        for other, layout in reversed(self.layouts.items()):
+            if other[:2] == key[:2] and np.max(np.abs(layout.points - points)) <= self.tolerance:
+                return other
+
+        return key
+
+    def cachedLayout( self , x , y , params , build ):
+        #Return the layout of the points (x, y) built with params, calling build(points) if there is none yet
+        points = np.column_stack((np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)))
+        key = self.__find(points, params)
+
+        layout = self.layouts.get(key)
+
+        if layout is None:
+            layout = build(points)
+            self.layouts[key] = layout
+
+            #Forget the least recently used layout
+            if len(self.layouts) > self.max_layouts:
+                self.layouts.popitem(last=False)
+        else:
+            self.layouts.move_to_end(key)
+
+        return layout
+
+    def layout( self , x , y , resX=100 , resY=100 ):
+
+        return self.cachedLayout(x, y, (resX, resY), lambda points: QtGridLayout(points, resX, resY))
+
+    def grid( self , x , y , z , resX=100 , resY=100 ):
+
+        layout = self.layout(x, y, resX, resY)
+
+        return layout.X, layout.Y, layout.interpolate(z)
+
+    def __group( self , xs , ys , resX , resY ):
+        #Group the light sources by sampling layout
+        groups = OrderedDict()
+        for n, (x, y) in enumerate(zip(xs, ys)):
+            layout = self.layout(x, y, resX, resY)
+            groups.setdefault(id(layout), (layout, []))[1].append(n)
+
+        return groups.values()
+
+    def gridMany( self , xs , ys , zs , resX=100 , resY=100 ):
+
+        results = [None]*len(zs)
+
+        #Interpolate every group with a single matrix product
+        for layout, members in self.__group(xs, ys, resX, resY):
+            Z = layout.interpolate(np.column_stack([ zs[n] for n in members ]))
+
+            for k, n in enumerate(members):
+                results[n] = (layout.X, layout.Y, Z[..., k])
+
+        return results
+
+    def gridCube( self , xs , ys , zs , resX=100 , resY=100 , out=None ):
+        #Interpolate all the light sources into one (n_lights, resY, resX) array;
+        #out may be any array of that shape, e.g. one from np.lib.format.open_memmap
+        num_lights = len(zs)
+
+        XI = np.empty((num_lights, resX))
+        YI = np.empty((num_lights, resY))
+        Z = np.empty((num_lights, resY, resX)) if out is None else out
+
+        for layout, members in self.__group(xs, ys, resX, resY):
+            G = layout.interpolate(np.column_stack([ zs[n] for n in members ]))
+
+            Z[members] = np.moveaxis(G, -1, 0)
+            XI[members] = layout.xi
+            YI[members] = layout.yi
+
+        return XI, YI, Z
+
+class QtTriLayout:
+
+    def __init__(self , points , subdiv , min_radius=0.0 ):
+
+        from matplotlib.tri import Triangulation, UniformTriRefiner
+
+        self.points = points
+        self.subdiv = subdiv
+        x, y = points[:,0], points[:,1]
+
+        #Triangulate the sampling layout once, leaving out the triangles centred within min_radius of the axis
+        self.triangulation = Triangulation(x, y)
+        if min_radius > 0:
+            triangles = self.triangulation.triangles
+            self.triangulation.set_mask(np.hypot(x[triangles].mean(axis=1), y[triangles].mean(axis=1)) < min_radius)
+
+        #Refine it once; every light source with this layout is drawn on the refined triangulation,
+        #which is shared and so must not be modified
+        self.refined, self.tri_index = UniformTriRefiner(self.triangulation).refine_triangulation(subdiv=subdiv, return_tri_index=True)
+
+    def refine( self , values ):
+        #Same as UniformTriRefiner.refine_field but without triangulating and refining again.
+        #Unlike the grid, the energy-minimising gradients are not exactly linear in the
+        #intensities, so each light source is interpolated on its own.
+        #values holds the intensities of one light source per column
+        from matplotlib.tri import CubicTriInterpolator, UniformTriRefiner
+
+        values = np.asarray(values, dtype=np.float64)
+
+        def cubic(column):
+            interpolator = CubicTriInterpolator(self.triangulation, column)
+
+            #The public interpolator(x, y) looks every node up again and masks the nodes it
+            #does not find on the edges of the hull, so the nodes are evaluated in the
+            #triangles they were refined from, as refine_field does. _interpolate_multikeys
+            #is private: it was checked against the matplotlib pinned in requirements and
+            #refine_field gives the same values, only slower, on versions without it.
+            if not hasattr(interpolator, '_interpolate_multikeys'):
+                return np.asarray(UniformTriRefiner(self.triangulation).refine_field(column, interpolator, self.subdiv)[1])
+
+            return np.asarray(interpolator._interpolate_multikeys(self.refined.x, self.refined.y, tri_index=self.tri_index)[0])
+
+        if values.ndim == 1:
+            return cubic(values)
+
+        return np.column_stack([ cubic(column) for column in values.T ])
+
+class QtTriEngine(QtGridEngine):
+
+    def __init__(self , tolerance=0.0 , max_layouts=64 , min_radius=0.0 ):
+        QtGridEngine.__init__(self, tolerance, max_layouts)
+        self.min_radius = min_radius
+
+    def layout( self , x , y , subdiv=3 ):
+
+        return self.cachedLayout(x, y, ('tri', subdiv, self.min_radius), lambda points: QtTriLayout(points, subdiv, self.min_radius))
+
+    def refine( self , x , y , z , subdiv=3 ):
+        #Returns the refined triangulation and the intensities at its nodes, like UniformTriRefiner.refine_field
+        layout = self.layout(x, y, subdiv)
+
+        return layout.refined, layout.refine(z)
+
+    def refineMany( self , xs , ys , zs , subdiv=3 ):
+        #Refine all the light sources, sharing the refined triangulation of each sampling layout
+        results = [None]*len(zs)
+
+        groups = OrderedDict()
+        for n, (x, y) in enumerate(zip(xs, ys)):
+            layout = self.layout(x, y, subdiv)
+            groups.setdefault(id(layout), (layout, []))[1].append(n)
+
+        for layout, members in groups.values():
+            Z = layout.refine(np.column_stack([ zs[n] for n in members ]))
+
+            for k, n in enumerate(members):
+                results[n] = (layout.refined, Z[:, k])
+
+        return results
+
+class QtLinearEngine:
+
+    def __init__(self , tolerance=1e-9 , cells_per_step=1 << 20 ):
+        #Interpolate the light sources linearly on the Delaunay triangulation of their own samples,
+        #as scipy.interpolate.griddata(method='linear') does, with array operations over all the
+        #light sources at once. Only the triangulation is done one light source at a time: the
+        #samples of the light sources wander too far for any one triangulation to fit them all.
+        #Cells within tolerance grid spacings of a triangle are taken as inside it, and about
+        #cells_per_step grid cells are filled in each step, which bounds the memory used.
+        self.tolerance = tolerance
+        self.cells_per_step = cells_per_step
+
+    def gridCube( self , xs , ys , zs , resX=100 , resY=100 , out=None ):
+        #Interpolate all the light sources into one (n_lights, resY, resX) array, NaN outside the
+        #samples of each light source, like QtGridEngine.gridCube
+        from scipy.spatial import Delaunay, QhullError
+
+        num_lights = len(zs)
+
+        points = [ np.column_stack((np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))) for x, y in zip(xs, ys) ]
+        values = np.concatenate([ np.asarray(z, dtype=np.float64).ravel() for z in zs ]) if num_lights else np.empty(0)
+        offsets = np.cumsum([0] + [ len(light) for light in points ])
+
+        triangles = []
+        for n, light in enumerate(points):
+            try:
+                triangles.append(Delaunay(light).simplices + offsets[n])
+            except (QhullError, ValueError):
+                #Too few distinct samples to triangulate, so the light source is left out
+                triangles.append(np.empty((0, 3), dtype=np.intp))
+
+        points = np.concatenate(points) if num_lights else np.empty((0, 2))
+        lights = np.repeat(np.arange(num_lights), [ len(light) for light in triangles ])
+        triangles = np.concatenate(triangles) if num_lights else np.empty((0, 3), dtype=np.intp)
+
+        counts = np.diff(offsets)
+        empty = counts == 0
+        first = np.minimum(offsets[:-1], max(len(points)-1, 0))
+        lows = np.where(empty[:,None], np.nan, np.minimum.reduceat(points, first, axis=0)) if len(points) else np.full((num_lights, 2), np.nan)
+        highs = np.where(empty[:,None], np.nan, np.maximum.reduceat(points, first, axis=0)) if len(points) else np.full((num_lights, 2), np.nan)
+
+        XI = np.linspace(lows[:,0], highs[:,0], resX, axis=1)
+        YI = np.linspace(lows[:,1], highs[:,1], resY, axis=1)
+        Z = np.empty((num_lights, resY, resX)) if out is None else out
+        Z[...] = np.nan
+
+        self.__rasterize(points, values, triangles, lights, XI, YI, Z)
+
+        return XI, YI, Z
+
+    def __rasterize( self , points , values , triangles , lights , XI , YI , Z ):
+        #Fill the grid cells of every light source covered by each of its triangles. A row of the grid
+        #crosses a triangle between its long edge, from its lowest to its highest vertex, and one of
+        #its two short edges, and the intensity is a plane over the triangle, so every row of every
+        #light source is a run of linear pieces, one for each triangle it crosses.
+        resX, resY = XI.shape[1], YI.shape[1]
+
+        def slope(x0, y0, x1, y1):
+            #Change of H per unit of V along an edge, 0 along a level edge
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(y1 > y0, (x1 - x0) / (y1 - y0), 0.0)
+
+        #Order the vertices of each triangle by V
+        corners = points[triangles]
+        order = np.argsort(corners[:,:,1], axis=1, kind='stable')
+        (x_lo, y_lo), (x_mid, y_mid), (x_hi, y_hi) = ( np.take_along_axis(corners, order[:,k,None,None], axis=1)[:,0].T for k in range(3) )
+
+        #Gradient of the plane through the intensities at the vertices
+        A, AB, AC = corners[:,0], corners[:,1] - corners[:,0], corners[:,2] - corners[:,0]
+        to_B = values[triangles[:,1]] - values[triangles[:,0]]
+        to_C = values[triangles[:,2]] - values[triangles[:,0]]
+        denominator = AB[:,0]*AC[:,1] - AB[:,1]*AC[:,0]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            gradient_x = (to_B*AC[:,1] - to_C*AB[:,1]) / denominator
+            gradient_y = (to_C*AB[:,0] - to_B*AC[:,0]) / denominator
+
+            dx = (XI[:,-1] - XI[:,0]) / (resX - 1)
+            dy = (YI[:,-1] - YI[:,0]) / (resY - 1)
+
+            #Rows of cells within tolerance of the triangle
+            first_row = np.ceil((y_lo - YI[lights,0]) / dy[lights] - self.tolerance)
+            last_row = np.floor((y_hi - YI[lights,0]) / dy[lights] + self.tolerance)
+
+        #Degenerate triangles cover no cells
+        live = (denominator != 0) & np.isfinite(first_row) & np.isfinite(last_row)
+        first_row = np.where(live, np.maximum(first_row, 0), 0).astype(np.intp)
+        last_row = np.where(live, np.minimum(last_row, resY-1), -1).astype(np.intp)
+        heights = np.maximum(last_row - first_row + 1, 0)
+
+        #What each row crossing a triangle needs of it, gathered at once
+        properties = np.column_stack(( x_lo , y_lo , x_mid , y_mid , slope(x_lo, y_lo, x_hi, y_hi) , slope(x_lo, y_lo, x_mid, y_mid) , slope(x_mid, y_mid, x_hi, y_hi) ,
+                                       values[triangles[:,0]] - gradient_x*A[:,0] - gradient_y*A[:,1] , gradient_x , gradient_y ,
+                                       XI[lights,0] , dx[lights] ))
+
+        #Every row each triangle crosses
+        triangle = np.repeat(np.arange(len(triangles)), heights)
+        row = first_row[triangle] + np.arange(len(triangle)) - np.repeat(np.cumsum(heights) - heights, heights)
+        light = lights[triangle]
+
+        x_lo, y_lo, x_mid, y_mid, slope_long, slope_low, slope_high, value_0, value_x, value_y, x_first, dx = properties[triangle].T
+
+        y = YI[light, row]
+        x_long = x_lo + (y - y_lo)*slope_long
+        x_short = np.where( y < y_mid , x_lo + (y - y_lo)*slope_low , x_mid + (y - y_mid)*slope_high )
+
+        first_col = np.maximum(np.ceil((np.minimum(x_long, x_short) - x_first) / dx - self.tolerance), 0).astype(np.intp)
+        last_col = np.minimum(np.floor((np.maximum(x_long, x_short) - x_first) / dx + self.tolerance), resX-1).astype(np.intp)
+
+        widths = np.maximum(last_col - first_col + 1, 0)
+
+        #The intensity along the row is value_0 + value_x*x
+        value_0 = value_0 + value_y*y
+
+        #Write into Z through a flat view unless it has none
+        XI_flat = XI.reshape(-1)
+        Z_flat = Z.reshape(-1) if Z.flags.c_contiguous else None
+        first_x = light*resX + first_col
+        first_z = (light*resY + row)*resX + first_col
+
+        ends = np.cumsum(widths)
+
+        #Split the rows into steps of about cells_per_step cells
+        bounds = np.searchsorted(ends, np.arange(self.cells_per_step, ends[-1] if len(ends) else 0, self.cells_per_step))
+        bounds = np.unique(np.concatenate(([0], bounds + 1, [len(widths)])))
+
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            step_widths = widths[start:stop]
+            if step_widths.sum() == 0:
+                continue
+
+            span = np.repeat(np.arange(start, stop), step_widths)
+            offset = np.arange(len(span)) - np.repeat(np.cumsum(step_widths) - step_widths, step_widths)
+
+            Z_values = value_0[span] + value_x[span]*XI_flat[first_x[span] + offset]
+
+            if Z_flat is not None:
+                Z_flat[first_z[span] + offset] = Z_values
+            else:
+                Z[light[span], row[span], first_col[span] + offset] = Z_values
+
+        return
@@ -0,0 +1,283 @@
+import os
+import itertools
+import numpy as np
+import pandas as pd
+
+#Compact column types of a measurement file
+DTYPES = {
+            'Light ID': np.int64,
+            '%ICAO': np.float32,
+            'I': np.float32,
+            'H': np.float32,
+            'V': np.float32,
+            'C': 'category',
+            'S': 'category'
+         }
+
+COLUMNS = tuple(DTYPES)
+
+class QtSchema:
+
+    def __init__(self , mapping=None , defaults=None , sheet=None , header_row=1 ):
+        #mapping gives the header in the file of each column it names differently, and defaults the
+        #value of each column the file does not hold, e.g. the Light ID of a scan of a single light
+        self.mapping = { column: column for column in COLUMNS }
+        self.mapping.update(mapping or {})
+        self.defaults = dict(defaults or {})
+
+        unknown = [ column for column in list(self.mapping) + list(self.defaults) if column not in DTYPES ]
+        if unknown:
+            raise ValueError('Unknown columns {0}; the columns of a measurement file are {1}'.format(', '.join(unknown), ', '.join(COLUMNS)))
+
+        if header_row < 1:
+            raise ValueError('The header row must be 1 or more, not {0}'.format(header_row))
+
+        #Sheet of a workbook the measurements are on (the active one by default) and row of its headers
+        self.sheet = sheet or None
+        self.headerRow = header_row
+
+    @classmethod
+    def fromConfig( cls , config ):
+        #Read the schema from [ColumnMapping], [ColumnDefaults] and [DataFrame]; the keys are
+        #matched to the columns regardless of case, since configparser lowers them
+        columns = { column.lower(): column for column in COLUMNS }
+
+        sections = []
+        for section in ('ColumnMapping', 'ColumnDefaults'):
+            entries = {}
+            if config.has_section(section):
+                for key, value in config.items(section, raw=True):
+                    if key not in columns:
+                        raise ValueError('Unknown column {0} in [{1}]; the columns of a measurement file are {2}'.format(key, section, ', '.join(COLUMNS)))
+                    entries[columns[key]] = value
+            sections.append(entries)
+
+        return cls( sections[0] , sections[1] ,
+                    sheet=config.get('DataFrame', 'sheet', fallback=None) ,
+                    header_row=config.getint('DataFrame', 'headerrow', fallback=1) )
+
+    def sources( self ):
+        #Columns read from the file, with their headers there
+        return { column: header for column, header in self.mapping.items() if column not in self.defaults }
+
+    def __repr__( self ):
+        return 'QtSchema({0!r}, {1!r}, sheet={2!r}, header_row={3!r})'.format(self.mapping, self.defaults, self.sheet, self.headerRow)
+
+def _typed(raw, path, first_row):
+    #Convert the raw values of a batch of rows to the compact column types, naming the first row
+    #of the file holding a value that does not fit
+    data = {}
+
+    for column, values in raw.items():
+        dtype = DTYPES[column]
+        values = pd.Series(values, dtype=object)
+
+        if dtype == 'category':
+            data[column] = values.where(values.isna(), values.astype(str)).astype('category')
+            continue
+
+        numbers = pd.to_numeric(values, errors='coerce')
+
+        bad = numbers.isna().values & values.notna().values
+        if dtype == np.int64:
+            #Light ids must all be given, and be whole numbers
+            bad = bad | values.isna().values | (numbers.values != np.floor(numbers.values))
+
+        if np.any(bad):
+            row = np.flatnonzero(bad)[0]
+            raise ValueError('Row {0} of {1}: {2} must be {3}, not {4!r}'.format(first_row+row, path, column, 'a whole number' if dtype == np.int64 else 'a number', values.iloc[row]))
+
+        data[column] = numbers.values.astype(dtype)
+
+    return data
+
+def _defaults(schema, num_rows):
+    return { column: np.full(num_rows, value, dtype=object) for column, value in schema.defaults.items() }
+
+def _csvChunks(path, schema, chunk_size):
+    sources = schema.sources()
+
+    headers = pd.read_csv(path, header=schema.headerRow-1, nrows=0).columns
+    missing = [ '{0} ({1})'.format(column, header) for column, header in sources.items() if header not in headers ]
+    if missing:
+        raise ValueError('{0} has no column for {1}'.format(path, ', '.join(missing)))
+
+    #Columns the file holds are parsed straight into their compact types by pandas
+    dtypes = { header: DTYPES[column] for column, header in sources.items() }
+    names = { header: column for column, header in sources.items() }
+
+    reader = pd.read_csv(path, header=schema.headerRow-1, usecols=list(dtypes), dtype=dtypes, chunksize=chunk_size)
+
+    for chunk in reader:
+        chunk = chunk.rename(columns=names)
+
+        for column, values in _typed(_defaults(schema, len(chunk)), path, 0).items():
+            chunk[column] = values
+
+        yield chunk[list(COLUMNS)]
+
+def _xlsxChunks(path, schema, chunk_size):
+    #Stream the rows of a sheet with openpyxl in read-only mode, holding one batch of rows at a time.
+    #When the mapped headers repeat, e.g. once per sensor side by side, each row holds one
+    #measurement per group of them, read left to right. The table ends at its first empty row.
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+
+    try:
+        if schema.sheet is None:
+            sheet = workbook.active
+        elif schema.sheet in workbook.sheetnames:
+            sheet = workbook[schema.sheet]
+        else:
+            raise ValueError('{0} has no sheet {1}; its sheets are {2}'.format(path, schema.sheet, ', '.join(workbook.sheetnames)))
+
+        rows = sheet.iter_rows(min_row=schema.headerRow, values_only=True)
+        headers = [ None if header is None else str(header).strip() for header in next(rows, ()) ]
+
+        sources = schema.sources()
+
+        positions = {}
+        for column, header in sources.items():
+            positions[column] = [ position for position, name in enumerate(headers) if name == header ]
+
+        missing = [ '{0} ({1})'.format(column, header) for column, header in sources.items() if not positions[column] ]
+        if missing:
+            raise ValueError('{0} has no column for {1} in row {2}'.format(path, ', '.join(missing), schema.headerRow))
+
+        num_groups = { len(found) for found in positions.values() }
+        if len(num_groups) > 1:
+            raise ValueError('The headers {0} must appear as many times each in row {1} of {2}'.format(', '.join(sources.values()), schema.headerRow, path))
+        num_groups = num_groups.pop() if num_groups else 1
+
+        #Every cell of the table is gathered by its position in the row
+        used = sorted({ position for found in positions.values() for position in found })
+        width = max(used) + 1 if used else 0
+
+        #Rows up to the first one without any of the mapped cells
+        table = itertools.takewhile(lambda row: any( position < len(row) and row[position] is not None for position in used ), rows)
+
+        first_row = schema.headerRow + 1
+        rows_per_batch = max(1, chunk_size // num_groups)
+        start = 0
+
+        while True:
+            batch = [ row[:width] + (None,)*(width-len(row)) for row in itertools.islice(table, rows_per_batch) ]
+            if not batch:
+                break
+
+            cells = np.empty((len(batch), width), dtype=object)
+            cells[:] = batch
+
+            #Measurements of a row in the order of their groups, one row after another
+            raw = { column: cells[:, found].ravel() for column, found in positions.items() }
+            raw.update(_defaults(schema, len(batch)*num_groups))
+
+            chunk = pd.DataFrame(_typed(raw, path, first_row), columns=COLUMNS)
+            chunk.index = pd.RangeIndex(start, start+len(chunk))
+
+            yield chunk
+
+            first_row = first_row + len(batch)
+            start = start + len(chunk)
+    finally:
+        workbook.close()
+
+#Readers of measurement files by extension; each yields frames of the columns of a file,
+#mapped by a QtSchema, of about chunk_size rows at a time
+READERS = { '.csv': _csvChunks, '.xlsx': _xlsxChunks, '.xlsm': _xlsxChunks }
+
+def registerReader(extension, reader):
+    #Read the measurement files with the given extension with reader(path, schema, chunk_size)
+    READERS[extension.lower()] = reader
+
+def iterChunks(path, schema=None, chunk_size=100000):
+
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension not in READERS:
+        raise ValueError('{0} is not a measurement file; the readable ones are {1}'.format(path, ', '.join(sorted(READERS))))
+
+    return READERS[extension](path, schema or QtSchema(), chunk_size)
+
+def readCSV(path):
+    #Read a whole measurement file with compact column types
+    return pd.read_csv(path, usecols=COLUMNS, dtype=DTYPES)
+
+def read(path, schema=None):
+    #Read a whole measurement file of any readable kind with compact column types
+    if schema is None:
+        schema = QtSchema()
+
+    #Files laid out like the ones inputgen writes are parsed at once
+    if os.path.splitext(path)[1].lower() == '.csv' and schema.headerRow == 1 and schema.sources() == { column: column for column in COLUMNS }:
+        return readCSV(path)
+
+    chunks = list(iterChunks(path, schema))
+    if not chunks:
+        return pd.DataFrame({ column: pd.Series(dtype=dtype) for column, dtype in DTYPES.items() }, columns=COLUMNS)
+
+    df = pd.concat(chunks, ignore_index=True)
+
+    #Batches with different categories are concatenated as objects
+    for column, dtype in DTYPES.items():
+        if dtype == 'category' and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+
+    return df
+
+def widen(values):
+    #Convert compact float32 values to float64 through their shortest decimal representation,
+    #so that a measured 12072.16 is not reported as 12072.160156
+    if values.dtype == np.float32:
+        return values.astype(str).astype(np.float64)
+    return values
+
+def _lightStarts(df):
+    #Positions where the block of rows of each light source starts
+    ids = df['Light ID'].values
+    return np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+
+def iterLights(path, *, schema=None, lights_per_batch=None, chunk_size=100000):
+    #Read a measurement file in chunks and yield frames holding only complete light sources,
+    #lights_per_batch of them at a time if given. The rows of each light source must be
+    #contiguous and the light ids increasing, as the instruments write them.
+    reader = iterChunks(path, schema, chunk_size)
+
+    pending = None
+
+    for chunk in reader:
+
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+
+        if np.any(np.diff(chunk['Light ID'].values) < 0):
+            raise ValueError('{0} must list the rows of each light in increasing order of Light ID to be streamed'.format(path))
+
+        #Hold back the rows of the last light source, which may continue in the next chunk
+        starts = _lightStarts(chunk)
+
+        if lights_per_batch is None:
+            cut = starts[-1]
+        else:
+            #Only yield whole batches, leaving the rest for the next chunk
+            num_batches = (len(starts)-1) // lights_per_batch
+            cut = starts[num_batches*lights_per_batch]
+
+            for b in range(num_batches):
+                yield chunk.iloc[starts[b*lights_per_batch]:starts[(b+1)*lights_per_batch]]
+
+        if lights_per_batch is None and cut > 0:
+            yield chunk.iloc[:cut]
+
+        pending = chunk.iloc[cut:]
+
+    if pending is not None and len(pending) > 0:
+
+        if lights_per_batch is None:
+            yield pending
+        else:
+            starts = np.append(_lightStarts(pending), len(pending))
+
+            for b in range(0, len(starts)-1, lights_per_batch):
+                yield pending.iloc[starts[b]:starts[min(b+lights_per_batch, len(starts)-1)]]
@@ -1,26 +1,207 @@
 import os
-import configparser
+import io
+import html
+import asyncio
+import inspect
 import datetime
+import tempfile
+import functools
+import contextlib
+import collections
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
-from numpy import average
 import pandas as pd
-from matplotlib import pyplot as plt
-from scipy.interpolate import griddata
-from scipy.interpolate.interpnd import CloughTocher2DInterpolator
-from jinja2 import Environment, FileSystemLoader
-import PyPDF2
-from weasyprint import HTML,CSS
 import QtUtils
 import QtConfigure
+import QtGrid
+import QtIngest
+import QtCache
+import QtPlot
+import QtTiming
+import QtCompliance
+import QtSurvey
 
-def grid(x, y, z, resX=100, resY=100):
+#Triangulations of the sampling layouts seen so far by grid()
+_grid_engine = QtGrid.QtGridEngine()
 
-    xi = np.linspace(min(x), max(x), resX)
-    yi = np.linspace(min(y), max(y), resY)
-    X, Y = np.meshgrid(xi, yi)
-    Z =  griddata((x, y) , z ,  (xi[None,:], yi[:,None]) ,method='cubic'   )
+def grid(x, y, z, resX=100, resY=100):
     
-    return X, Y, Z
+    return _grid_engine.grid(x, y, z, resX, resY)
+
+def gridCube(xs, ys, zs, resX=100, resY=100, out=None):
+    #Returns the grid axes of each light, shaped (n_lights, resX) and (n_lights, resY),
+    #and the intensities of all the lights, shaped (n_lights, resY, resX)
+    return _grid_engine.gridCube(xs, ys, zs, resX, resY, out)
+
+class QtLightIndex:
+
+    def __init__(self , df ):
+        #Sort the rows by light id, keeping the order of the measurements of each light source
+        self.order = np.argsort(df['Light ID'].values, kind='stable')
+
+        ids = df['Light ID'].values[self.order]
+
+        #Find where the block of rows of each light source starts
+        self.ids, starts, self.counts = np.unique(ids, return_index=True, return_counts=True)
+        self.offsets = np.append(starts, len(ids))
+
+        #Keep the measurements as contiguous arrays so that every light can be sliced without copying
+        self.H = np.ascontiguousarray(df['H'].values[self.order], dtype=np.float64)
+        self.V = np.ascontiguousarray(df['V'].values[self.order], dtype=np.float64)
+        #Widen I through its decimal representation, as the summary table does, so that the
+        #averages are not taken over the float32 rounding of the measurements
+        self.I = np.ascontiguousarray(QtIngest.widen(df['I'].values[self.order]), dtype=np.float64)
+
+        #Map each light id to its position in the index
+        self.positions = { id : pos for pos, id in enumerate(self.ids.tolist()) }
+
+        return
+
+    @classmethod
+    def fromArrays( cls , arrays ):
+        #Rebuild an index around previously computed arrays, e.g. memory-mapped from the cache
+        index = cls.__new__(cls)
+
+        for name, values in arrays.items():
+            setattr(index, name, values)
+
+        index.positions = { id : pos for pos, id in enumerate(index.ids.tolist()) }
+
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def span(self , light_id ):
+        pos = self.positions[light_id]
+        return self.offsets[pos], self.offsets[pos+1]
+
+    def light(self , light_id ):
+        #Return views onto the H, V and I measurements of a light source
+        start, end = self.span(light_id)
+        return self.H[start:end], self.V[start:end], self.I[start:end]
+
+    def argmax(self):
+        #Compute the maximum intensity of each light source, ignoring missing values
+        imax = np.fmax.reduceat(self.I, self.offsets[:-1])
+
+        #Pick the first row of each light source that holds its maximum
+        segments = np.repeat(np.arange(len(self.ids)), self.counts)
+        candidates = np.flatnonzero(self.I == imax[segments])
+        found, first = np.unique(segments[candidates], return_index=True)
+
+        #Fall back to the first row of a light source whose intensities are all missing
+        rows = self.offsets[:-1].copy()
+        rows[found] = candidates[first]
+
+        return rows
+
+    def mean(self):
+        #Average the intensity of each light source, ignoring missing values
+        valid = ~np.isnan(self.I)
+        sums = np.add.reduceat(np.where(valid, self.I, 0.0), self.offsets[:-1])
+        counts = np.add.reduceat(valid, self.offsets[:-1])
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sums / counts
+
+def summarize(df , index=None ):
+    #Group the rows of each light source in increasing order of their ids
+    if index is None:
+        index = QtLightIndex(df)
+
+    #Locate the row holding the maximum intensity of each light source
+    rows = index.argmax()
+    maxIDF = df.iloc[index.order[rows]]
+
+    data = {
+            'Light ID': index.ids,
+            '%ICAO': QtIngest.widen(maxIDF['%ICAO'].values),
+            'Iavg': index.mean(),
+            'Imax' : QtIngest.widen(maxIDF['I'].values),
+            'Hmax' : QtIngest.widen(maxIDF['H'].values),
+            'Vmax' : QtIngest.widen(maxIDF['V'].values),
+            'C' : maxIDF['C'].values,
+            'S' : maxIDF['S'].values
+        }
+
+    columns =('Light ID','%ICAO', 'Iavg','Imax','Hmax','Vmax','C','S')
+
+    #construct a dataframe 
+    mtab_df = pd.DataFrame(data,columns=columns)
+
+    #set 'LightID' as index
+    mtab_df.set_index(['Light ID'],inplace=True)
+
+    return mtab_df
+
+#Most decimals the numbers of the summary table are written with, as DataFrame.to_html writes them
+TABLE_DECIMALS = 6
+
+def _columnDecimals(values):
+    #Decimals a column of numbers needs: TABLE_DECIMALS less the trailing zeros all of its values
+    #share, but at least one, as DataFrame.to_html trims them
+    text = np.char.mod('%.{0}f'.format(TABLE_DECIMALS), values[np.isfinite(values)])
+
+    if len(text) == 0:
+        return 1
+
+    zeros = np.char.str_len(text) - np.char.str_len(np.char.rstrip(text, '0'))
+
+    return max(TABLE_DECIMALS - int(zeros.min()), 1)
+
+def tableRows(mtab_df):
+    #Format every row of the summary table as HTML at once, a column at a time, for the pages
+    #to join their rows into the same table DataFrame.to_html would write. Each column of numbers
+    #is written with the decimals its values need, the same on every page
+    cells = []
+
+    for position, column in enumerate(mtab_df.columns):
+        values = mtab_df.iloc[:, position]
+
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            labels = np.array([ html.escape(str(label)) for label in values.cat.categories ] + ['NaN'], dtype=object)
+            cells.append(labels[values.cat.codes.values])
+        elif pd.api.types.is_float_dtype(values.dtype):
+            values = values.values.astype(np.float64)
+            text = np.char.mod('%.{0}f'.format(_columnDecimals(values)), values).astype(object)
+            text[np.isnan(values)] = 'NaN'
+            cells.append(text)
+        else:
+            #Whole numbers and labels read without a category type are written as they are
+            cells.append(np.array([ 'NaN' if pd.isna(value) else html.escape(str(value)) for value in values.values ], dtype=object))
+
+    row_format = '    <tr>\n      <th>{0}</th>\n' + ''.join( '      <td>{{{0}}}</td>\n'.format(c+1) for c in range(len(cells)) ) + '    </tr>\n'
+
+    return [ row_format.format(*row) for row in zip(mtab_df.index.values, *cells) ]
+
+def tableHTML(mtab_df, rows):
+    #Wrap rows from tableRows in the head of the summary table
+    cells = ''.join( '      <th>{0}</th>\n'.format(html.escape(str(column))) for column in mtab_df.columns )
+    blanks = '      <th></th>\n' * len(mtab_df.columns)
+
+    return ( '<table border="1" class="dataframe">\n  <thead>\n    <tr style="text-align: right;">\n      <th></th>\n' + cells +
+             '    </tr>\n    <tr>\n      <th>{0}</th>\n'.format(html.escape(str(mtab_df.index.name))) + blanks +
+             '    </tr>\n  </thead>\n  <tbody>\n' + ''.join(rows) + '  </tbody>\n</table>' )
+
+#Progress of a report: stage is 'plotted' or 'rendered' with the number of the page
+#('rendered' with None for a single document), then 'merged' once the report is written
+QtProgress = collections.namedtuple('QtProgress', ('stage', 'page_no', 'num_of_pages'))
+
+#The report each worker process renders pages of
+_worker_report = None
+
+#The templates compiled by this process, by location
+_templates = {}
+
+def _initWorker(report):
+    global _worker_report
+    _worker_report = report
+
+def _renderPage(page, index=None):
+    #Send the timings of the page back along with it
+    return _worker_report.generatePage(*page, index=index), _worker_report.timer.drain()
 
 class QtReport:
 
@@ -29,257 +210,512 @@ class QtReport:
         #Configure the DLL searc path the weasyprint module depends on 
         QtUtils.setDLLSearchPath()
 
-        #Configure the underlying settings
-        QtConfigure.QtConfig()
-
-        self.config = configparser.ConfigParser();
-        self.config.read("QtConfig.ini")
+        #Configure the underlying settings once per process and keep a copy for this report
+        self.config = QtConfigure.getConfig()
         
         self.reportFileName = report_file_name
         self.agentName = agent_name
         self.airportName = airport_name
         self.wayName = way_name
         
-        #Initialze a list for keeping track of the individual pdf files generated 
-        self.pdfNames = []
+        #Initialze a list for keeping track of the files of the individual pdf pages generated 
+        self.pdfPages = []
+
+        #Keep the plots of earlier reports so that only the pages whose lights changed are drawn again
+        self.pageCache = None
+        if self.config['ReportFormat'].getboolean('incremental', fallback=False):
+            self.pageCache = QtCache.QtPageCache(os.path.join(self.config['Locations']['cachelocation'],'pages'))
+        #Reuse the triangulation of each sampling layout across light sources
+        self.gridEngine = QtGrid.QtGridEngine( tolerance=self.config['ContourFormat'].getfloat('gridtolerance', fallback=0.0) )
+        #Check the lights against their ICAO isocandela diagram if asked to
+        self.compliance = QtCompliance.QtCompliance.fromConfig(self.config)
+        self.triEngine = QtGrid.QtTriEngine( tolerance=self.config['ContourFormat'].getfloat('gridtolerance', fallback=0.0) )
+        #Keep the summary table of each report as a survey of its way, to trend the lights over time
+        self.surveyStore = None
+        if self.__storeSurvey() or self.__trendPage():
+            self.surveyStore = QtSurvey.QtSurveyStore( self.config['Locations'].get('surveylocation', fallback=os.path.join(os.path.dirname(self.config['Locations']['reportlocation']),'surveys')) )
+        #Time each stage of the report per page if asked to
+        self.timer = QtTiming.QtTimer( enabled=self.config.getboolean('Profiling', 'timing', fallback=False) ,
+                                       trace_memory=self.config.getboolean('Profiling', 'tracememory', fallback=False) )
+
         #Store dataframe
-        self.df = df
-        #Transform dataframe
-        self.__transformDF()
+        self.df = None
+        self.index = None
+        self.mtab_df = None
+        self.cache = None
+
+        #A path to a measurement file is either read at once or, in streaming mode, chunk by chunk
+        self.source = None
+        #Columns of the measurement files and how they map onto the ones of a report
+        self.schema = QtIngest.QtSchema.fromConfig(self.config)
 
-        self.gminI = self.df['I'].min()
-        self.gmaxI = self.df['I'].max()
+        self.colourScale = None
+
+        if isinstance(df, (str, os.PathLike)):
+            with self.timer.stage('load'):
+                self.__load(df)
+        else:
+            self.df = df
+
+        if self.mtab_df is None:
+            with self.timer.stage('summarize'):
+                self.__summarize()
+
+            if self.cache is not None:
+                self.cache.store( self.cacheKey , self.index , self.mtab_df , self.gminI , self.gmaxI )
+                self.cache.prune( self.cacheSize )
 
         return
 
-    def __transformDF(self):
-        #Extract all the light sources and sort them in increasing order of their ids
-        id_list = np.sort(self.df['Light ID'].unique())
-    
-        imax_list = []
-        iavg_list = []
-        hmax_list = []
-        vmax_list = []
-        icao_list = []
-        color_list = []
-        outcome_list = []
-
-        #Extract necessary information from the initial dataframe
-        for id in id_list:
-
-            imax = self.df.loc[self.df['Light ID'] == id]['I'].max()
-            maxIDF = self.df.loc[self.df['I'] == imax]
-            hmax = maxIDF.iloc[0]['H']
-            vmax = maxIDF.iloc[0]['V']
-            iavg = self.df.loc[self.df['Light ID'] == id]['I'].mean()
-
-            icao = maxIDF.iloc[0]['%ICAO']
-            color = maxIDF.iloc[0]['C']
-            outcome = maxIDF.iloc[0]['S']
-
-            imax_list.append(imax)
-            iavg_list.append(iavg)
-            hmax_list.append(hmax)
-            vmax_list.append(vmax)
-            icao_list.append(icao)
-            color_list.append(color)
-            outcome_list.append(outcome)
-
-        data = {
-                'Light ID': id_list,
-                '%ICAO': icao_list,
-                'Iavg': iavg_list,
-                'Imax' : imax_list,
-                'Hmax' : hmax_list,
-                'Vmax' : vmax_list,
-                'C' : color_list,
-                'S' : outcome_list
-            }
-        
-        columns =('Light ID','%ICAO', 'Iavg','Imax','Hmax','Vmax','C','S')
+    def __summarize(self):
 
-        #construct a dataframe 
-        self.mtab_df = pd.DataFrame(data,columns=columns)
-        
-        #set 'LightID' as index
-        self.mtab_df.set_index(['Light ID'],inplace=True)
+        if self.source is None:
+            #Index the rows of each light source once for all later stages
+            self.index = QtLightIndex(self.df)
+            #Transform dataframe
+            self.__transformDF()
+
+            self.gminI = np.nanmin(self.index.I)
+            self.gmaxI = np.nanmax(self.index.I)
+
+            #The light index holds every measurement the pages are drawn from, so the raw rows
+            #are let go rather than kept, and sent to every worker process, for the whole report
+            self.df = None
+        else:
+            #Only the rows of the lights on the page being rendered are kept in memory
+            self.__transformStream()
 
         return
 
-    def __plot( self , page_no , start_row , end_row ):
+    def __load(self , path ):
 
-        H = []
-        V = []
-        I = []
-        Hmax = []
-        Vmax = []
-        
-        #Prepare the specified number of sets of data to be plotted (default=6)
-        for cur_id in range(start_row+1 , end_row+2):
+        #Reuse the parsed data and summary table of a measurement file seen before
+        if self.config['DataFrame'].getboolean('cache', fallback=False):
+            cache_size = self.config['DataFrame'].getfloat('cachesize', fallback=1024.0)
 
-            cur_df = self.df.loc[self.df['Light ID'] == cur_id]
+            if cache_size < 0:
+                raise ValueError('cacheSize must not be negative, not {0:g}'.format(cache_size))
 
-            imax = cur_df['I'].max()
-            maxIDF = self.df.loc[self.df['I'] == imax]
-            hmax = maxIDF.iloc[0]['H']
-            vmax = maxIDF.iloc[0]['V']
+            self.cache = QtCache.QtCache(self.config['Locations']['cachelocation'])
+            self.cacheSize = int(cache_size*1024*1024)
+            self.cacheKey = self.cache.key(path, self.schema, self.compliance)
 
-            #print('Light ID {} Hmax {} Vmax {}'.format(cur_id,hmax,vmax))
+            cached = self.cache.load(self.cacheKey)
 
-            cur_idx = (cur_id-1)%self.num_rows_per_page
+            if cached is not None:
+                arrays, self.mtab_df, (self.gminI, self.gmaxI) = cached
 
-            H.append(cur_df['H'])
-            V.append(cur_df['V'])
-            I.append(cur_df['I'])
-            Hmax.append(hmax)
-            Vmax.append(vmax)
+                #Entries stored in streaming mode hold no light index, so the pages are streamed again
+                if arrays is None:
+                    self.source = path
+                else:
+                    self.index = QtLightIndex.fromArrays(arrays)
+
+                return
 
-            H[cur_idx],V[cur_idx],I[cur_idx] = grid(H[cur_idx],V[cur_idx],I[cur_idx])
+        if self.config['DataFrame'].getboolean('streaming', fallback=False):
+            self.source = path
+        else:
+            self.df = QtIngest.read(path, self.schema)
 
-        #Compute the number of subplots
-        nSubplots = len(H)
+        return
 
-        #Set up plots
-        nrows = self.num_rows_per_page
+    def __transformDF(self):
+        #Build the summary table in a single grouped pass over the data
+        self.mtab_df = self.__summaryTable(self.df, self.index)
 
-        fig, ax = plt.subplots(nrows=1, ncols=nrows,figsize=(50,6))
-        plt.subplots_adjust(wspace=0.01,left=0.025, right=1.0)
+        return
 
-        #Choose the number of contour levels
-        nlevels = int(self.config['ContourFormat']['nlevels'])
-        levels = np.linspace(0,self.gmaxI,nlevels+1)
-        cticks = np.arange(0,self.gmaxI,2000)
+    def __summaryTable(self , df , index ):
 
-        #Determine whether to disable the axis for each (row,col)
-        for row in range(0,nrows):
-                if row < nSubplots:
-                    ax[row].axis('on')
-                else:
-                    ax[row].axis('off')
-
-        #plot the contour for each entry
-        for row in range(0,nrows):
-            if row <nSubplots:   
-                cs = ax[row].contour(H[row],V[row],I[row], levels=levels, linewidths=0.4, linestyles='dashed', colors='k') 
-                    
-                csf = ax[row].contourf(H[row],V[row],I[row],levels=levels, cmap='Spectral_r',extend='both')
-                    
-                ax[row].plot([Hmax[row]],[Vmax[row]],marker='X',color='black')
-
-                ax[row].set_title('Light ID: {0}'.format(start_row+row+1),fontsize=10)
-
-        fig.supxlabel('Horizontal Degrees')
-        fig.supylabel('Vertical Degrees')
-        fig.suptitle('Vertical Scanning')
-
-        fig.subplots_adjust(right=0.8)
-        bar_ax = fig.add_axes([0.82, 0.15, 0.001, 0.80])
-        fig.colorbar(csf,cax=bar_ax,ticks=cticks) 
-        #set up the title and the x- and y-axis
-        
+        mtab_df = summarize(df, index)
 
-        #save the plot as an image file
-        save_as = os.path.join( self.config['Locations']['templocation'] , '{0}-{1}.png'.format(self.reportFileName,page_no))
+        if self.compliance is not None:
+            with self.timer.stage('compliance'):
+                mtab_df = mtab_df.join(self.compliance.checkLights(index))
+
+        return mtab_df
+
+    def __chunkSize(self):
+        return self.config['DataFrame'].getint('chunksize', fallback=100000)
+
+    def __transformStream(self):
+        #Build the summary table and the global intensity range one chunk of lights at a time
+        tables = []
+        self.gminI = np.inf
+        self.gmaxI = -np.inf
+
+        for chunk in QtIngest.iterLights( self.source , schema=self.schema , chunk_size=self.__chunkSize() ):
+            index = QtLightIndex(chunk)
+            tables.append(self.__summaryTable(chunk, index))
+
+            self.gminI = min(self.gminI, np.nanmin(index.I))
+            self.gmaxI = max(self.gmaxI, np.nanmax(index.I))
+
+        self.mtab_df = pd.concat(tables)
 
-        #save the plot
-        plt.savefig( save_as , dpi=400 ,bbox_inches='tight' )
-        plt.close()
-        
         return
 
-    def __onePDF( self , * , html_page , page_no ):
+    def __pageIndices(self , pages ):
+        #Yield the index of the lights of each page, or None when the whole data is in memory
+        if self.source is None:
+            for page in pages:
+                yield None
+        else:
+            for chunk in QtIngest.iterLights( self.source , schema=self.schema , lights_per_batch=self.num_rows_per_page , chunk_size=self.__chunkSize() ):
+                yield QtLightIndex(chunk)
 
-        save_as = os.path.join( self.config['Locations']['templocation'] , '{0}-{1}.pdf'.format(self.reportFileName,page_no) )
+    def __plotFormat( self ):
+        #The contours are saved as a png or jpg raster, or as an svg that WeasyPrint embeds as vectors
+        image_format = self.config['ContourFormat'].get('imageformat', fallback='png').lower()
 
-        #Set base url to img folder
-        HTML( string=html_page , base_url='img' ).write_pdf(save_as) 
+        if image_format not in QtPlot.IMAGE_FORMATS:
+            raise ValueError('imageFormat must be one of {0}, not {1}'.format(', '.join(QtPlot.IMAGE_FORMATS), image_format))
+
+        return image_format
+
+    def __contourBackend( self ):
+        #The contours are drawn on a grid interpolated with griddata's cubic method, or on a refined triangulation
+        backend = self.config['ContourFormat'].get('backend', fallback='grid').lower()
+
+        if backend not in QtPlot.CONTOUR_BACKENDS:
+            raise ValueError('backend must be one of {0}, not {1}'.format(', '.join(QtPlot.CONTOUR_BACKENDS), backend))
+
+        return backend
+
+    def __plotName( self , page_no ):
+        return '{0}-{1}.{2}'.format(self.reportFileName, page_no, self.__plotFormat())
+
+    def __debug( self ):
+        #In debug mode every plot, html page and pdf page is also written to the temp folder
+        return self.config['ReportFormat'].getboolean('debug', fallback=False)
+
+    def __saveTemp( self , name , data ):
+
+        save_as = os.path.join( self.config['Locations']['templocation'] , name )
+
+        with open( save_as , 'wb' ) as temp_file:
+            temp_file.write(data)
 
         QtUtils.displayInfo('{0} was made...'.format(save_as))
 
         return
+
+    def __colourScale( self ):
+        #The contour levels and their colours are worked out once per report and shared by its pages
+        if self.colourScale is None:
+            #Choose the number of contour levels
+            nlevels = int(self.config['ContourFormat']['nlevels'])
+            levels = np.linspace(0,self.gmaxI,nlevels+1)
+            cticks = np.arange(0,self.gmaxI,2000)
+
+            self.colourScale = QtPlot.QtColourScale( levels , cticks )
+
+        return self.colourScale
+
+    def __plot( self , page_no , start_row , end_row , index ):
+
+        #Select the entries of the current page
+        page_df = self.mtab_df.iloc[start_row:end_row+1]
+
+        Ids = page_df.index
+        Hmax = page_df['Hmax'].values
+        Vmax = page_df['Vmax'].values
+
+        #Prepare the specified number of sets of data to be plotted (default=6)
+        H, V, I = zip(*[ index.light(cur_id) for cur_id in Ids ])
+
+        #Redraw the figure kept by this process for the current number of rows per page
+        figure = QtPlot.contourFigure(self.num_rows_per_page)
+
+        if self.__contourBackend() == 'tri':
+            #Refine the intensities of each light on the refined triangulation of its sampling layout
+            with self.timer.stage('interpolate', page_no):
+                refined = self.triEngine.refineMany(H,V,I,self.config['ContourFormat'].getint('subdiv', fallback=3))
+
+            with self.timer.stage('contour', page_no):
+                figure.drawTri( refined , Ids , Hmax , Vmax , scale=self.__colourScale() )
+        else:
+            #Interpolate all the lights of the page into one (n_lights, resY, resX) array
+            with self.timer.stage('interpolate', page_no):
+                H, V, I = self.gridEngine.gridCube(H,V,I)
+
+            with self.timer.stage('contour', page_no):
+                figure.draw( H , V , I , Ids , Hmax , Vmax , scale=self.__colourScale() )
+
+        #Render the plot into memory
+        image = io.BytesIO()
+
+        with self.timer.stage('encode', page_no):
+            figure.save( image , self.__plotFormat() , self.config['ContourFormat'].getint('dpi', fallback=400) )
+        
+        return image.getvalue()
+
+    def __renderPDF( self , html_page , plots , target=None ):
+        from weasyprint import HTML, default_url_fetcher
+
+        #plots maps the URL of each plot kept in memory to its image
+        mime_type = QtPlot.MIME_TYPES[self.__plotFormat()]
+
+        #Serve the plots from memory and anything else the usual way
+        def fetchURL(url):
+            if url in plots:
+                return { 'string': plots[url] , 'mime_type': mime_type }
+            return default_url_fetcher(url)
+
+        #Set base url to img folder
+        return HTML( string=html_page , base_url='img' , url_fetcher=fetchURL ).write_pdf(target)
+
+    def __renderHTML( self , pages ):
+        #Render the given pages through the template as one document
+        return self.template.render( pages=pages , **self.context )
     
-    def __generateOnePDF( self , page_no , start_row , end_row ):
+    def __plotFingerprint( self , start_row , end_row , index ):
+        #Everything the contours of a page are drawn from
+        page_df = self.mtab_df.iloc[start_row:end_row+1]
+
+        parts = [ float(self.gmaxI) , self.num_rows_per_page , sorted(self.config['ContourFormat'].items()) , page_df.index.values , page_df[['Hmax','Vmax']].values ]
+
+        for cur_id in page_df.index:
+            parts.extend(index.light(cur_id))
 
-         #Draw contours
-        self.__plot(page_no, start_row, end_row)
+        return QtCache.fingerprint(*parts)
 
-        #Get the entries for the current page
-        cur_df = self.mtab_df.iloc[start_row:end_row+1] #end_row exclusive
+    def __plotPath( self , page_no , plot ):
 
-        #Convert the dataframe into an HTML table, excluding the index column
-        m_table = cur_df.to_html(index=True) 
+        if self.__debug():
+            #The page links to the plot in the temp folder instead of the one in memory
+            self.__saveTemp( self.__plotName(page_no) , plot )
+            return '../tmp/' + self.__plotName(page_no)
+
+        #WeasyPrint percent-encodes the URL before fetching it, so names with spaces or non-ASCII
+        #characters are quoted here already, which it leaves as they are
+        return QtPlot.PLOT_SCHEME + urllib.parse.quote(self.__plotName(page_no))
+
+    def __preparePage( self , page_no , start_row , end_row , index ):
+        #Draw the plot of a page and gather what the template needs to lay it out
+        if index is None:
+            index = self.index
+
+        plot_ext = '.' + self.__plotFormat()
+        plot = None
+
+        if self.pageCache is not None:
+            #Only draw the contours if the lights on this page or the colour scale have changed
+            plot_fingerprint = self.__plotFingerprint(start_row, end_row, index)
+            plot = self.pageCache.get(plot_fingerprint, plot_ext)
+
+        if plot is None:
+            #Draw contours
+            plot = self.__plot(page_no, start_row, end_row, index)
+
+            if self.pageCache is not None:
+                self.pageCache.put(plot_fingerprint, plot_ext, plot)
+
+        page = {
+                    'page_no': page_no,
+                    #Join the rows of the entries for the current page into an HTML table
+                    'm_table': tableHTML(self.mtab_df, self.tableRows[start_row:end_row+1]),
+                    'plot_path': self.__plotPath( page_no , plot )
+               }
+
+        return page, plot
+
+    def __renderPage( self , page , plot ):
         
         #Render each page 
-        html_page =  self.template.render(
-                                    m_table=m_table,
-                                    page_no=page_no, 
-                                    report_file_name=self.reportFileName,  
-                                    air_port_name=self.airportName,
-                                    way_name=self.wayName,
-                                    agent_name=self.agentName,  
-                                    date_of_report=QtUtils.getDate(self.datetime_of_report),
-                                    time_of_report=QtUtils.getTime(self.datetime_of_report),
-                                    plot_path='{0}-{1}.png'.format(self.reportFileName,page_no)   
-                                )
-
-        self.pdfNames.append('{0}-{1}.pdf'.format(self.reportFileName,page_no))
-
-        #Compute the name of the current HTML
-        save_as = os.path.join( self.config['Locations']['templocation'] , '{0}-{1}.html'.format(self.reportFileName,page_no) ) 
-        
-        with open( save_as , 'w' , encoding='utf-8') as html_file: 
-            html_file.write(html_page)
+        with self.timer.stage('html', page['page_no']):
+            html_page = self.__renderHTML([page])
 
-        QtUtils.displayInfo('{0} was made...'.format(save_as))
+        if self.__debug():
+            self.__saveTemp( '{0}-{1}.html'.format(self.reportFileName,page['page_no']) , html_page.encode('utf-8') )
+
+        #Export as a pdf file. The pdfs of the pages are not kept in the page cache: every page
+        #carries the date and time of the report, so a page kept from an earlier report would
+        #either show when that report was made or never be reused.
+        with self.timer.stage('pdf', page['page_no']):
+            pdf = self.__renderPDF( html_page , { page['plot_path']: plot } )
+
+        if self.__debug():
+            self.__saveTemp( '{0}-{1}.pdf'.format(self.reportFileName,page['page_no']) , pdf )
+
+        return pdf
+
+    def __generateOnePDF( self , page_no , start_row , end_row , index=None ):
 
-        #Export as a pdf file
-        self.__onePDF( html_page=html_page , page_no=page_no )
+        page, plot = self.__preparePage( page_no , start_row , end_row , index )
+
+        return self.__renderPage( page , plot )
+
+    def __storeSurvey( self ):
+        return self.config.getboolean('Survey', 'store', fallback=False)
+
+    def __trendPage( self ):
+        return self.config.getboolean('Survey', 'trendpage', fallback=False)
+
+    def __recordSurvey( self ):
+        #Append the summary table to the surveys of this way, once the report has been written
+        if self.__storeSurvey():
+            with self.timer.stage('survey'):
+                self.surveyStore.append( self.airportName , self.wayName , self.datetime_of_report , self.mtab_df , self.reportFileName )
 
         return
 
-    def __mergePDFs(self):
+    def __prepareTrend( self , page_no ):
+        #Plot the surveys of this way and list the lights below the threshold in the last one, worst
+        #first, with their %ICAO in the latest surveys; None without a trend page. The summary table
+        #of this report is only stored once it has been written, so it is added as the last survey.
+        if not self.__trendPage():
+            return None
 
-        input_dir = self.config['Locations']['templocation']
-        output_dir = self.config['Locations']['reportlocation']
+        icao = self.config.getfloat('Survey', 'threshold', fallback=100.0)
+        pending = (self.datetime_of_report, self.mtab_df)
+
+        with self.timer.stage('trend', page_no):
+            trend = self.surveyStore.trend( self.airportName , self.wayName , icao , pending=pending )
+
+            below = self.surveyStore.below( self.airportName , self.wayName , icao , pending=pending )
+            lights = below.index[:self.config.getint('Survey', 'trendlights', fallback=15)]
+
+            history = self.surveyStore.history( self.airportName , self.wayName , lights , pending=pending )
+            history = history.iloc[:, -self.config.getint('Survey', 'trendsurveys', fallback=5):]
+            history.columns = [ timestamp.strftime('%d/%m/%Y %H:%M') for timestamp in history.columns ]
+
+            plot = io.BytesIO()
+            QtPlot.drawTrend( trend , icao , plot , self.__plotFormat() , self.config['ContourFormat'].getint('dpi', fallback=400) )
+
+        plot = plot.getvalue()
+
+        page = {
+                    'page_no': page_no,
+                    'm_table': tableHTML(history, tableRows(history)),
+                    'plot_path': self.__plotPath( page_no , plot )
+               }
+
+        return page, plot
+
+    def __singleDocument( self ):
+        #Lay all the pages out in one WeasyPrint pass instead of merging one pdf per page
+        return self.config['ReportFormat'].getboolean('singledocument', fallback=False)
+
+    def __profile( self , page_no ):
+        #Profile the page chosen in the config with cProfile, writing its statistics next to the report
+        if page_no != self.config.getint('Profiling', 'profilepage', fallback=0):
+            return contextlib.nullcontext()
+
+        return self.timer.profile(os.path.join(self.config['Locations']['reportlocation'],'{0}-{1}.prof'.format(self.reportFileName,page_no)))
+
+    def __profiled( self , page_no , function , *args ):
+        with self.__profile(page_no):
+            return function(*args)
+
+    def generatePage( self , page_no , start_row , end_row , index=None ):
+        #Render one page and return its pdf as bytes, or in single document mode
+        #return the page for the template together with its plot
+        with self.__profile(page_no):
+            if self.__singleDocument():
+                return self.__preparePage( page_no , start_row , end_row , index )
+
+            return self.__generateOnePDF( page_no , start_row , end_row , index )
+
+    def __timingFormat( self ):
+        timing_format = self.config.get('Profiling', 'timingformat', fallback='json').lower()
+
+        if timing_format not in QtTiming.TIMING_FORMATS:
+            raise ValueError('timingFormat must be one of {0}, not {1}'.format(', '.join(QtTiming.TIMING_FORMATS), timing_format))
+
+        return timing_format
+
+    def __exportTiming( self ):
+        #Write the timings of the report next to it
+        if not self.timer.enabled:
+            return
+
+        timing_format = self.__timingFormat()
+
+        save_as = os.path.join(self.config['Locations']['reportlocation'],'{0}.timing.{1}'.format(self.reportFileName,QtTiming.TIMING_FORMATS[timing_format]))
+        self.timer.write( save_as , timing_format , self.reportFileName )
+
+        return
+
+    def __writeDocument( self , prepared ):
+
+        pages = [ page for page, plot in prepared ]
+        plots = { page['plot_path']: plot for page, plot in prepared }
+
+        with self.timer.stage('html'):
+            html_document = self.__renderHTML(pages)
+
+        if self.__debug():
+            self.__saveTemp( '{0}.html'.format(self.reportFileName) , html_document.encode('utf-8') )
 
-        merge_list = []
+        #Fonts, styles and images are shared by every page of the document
+        save_as = os.path.join(self.config['Locations']['reportlocation'],'{0}.pdf'.format(self.reportFileName))
 
-        for f in os.listdir(input_dir):
-            if f in self.pdfNames:
-                merge_list.append(os.path.join(input_dir,f))
+        with self.timer.stage('pdf'):
+            self.__renderPDF( html_document , plots , save_as )
 
-        merge_list.sort(key=lambda f: int(''.join(filter(str.isdigit, f))))
-        #sorted(merge_list)
+        return
+
+    def __mergePDFs(self):
+        with self.timer.stage('merge'):
+            self.__writeMerged()
+
+        return
+
+    def __writeMerged(self):
+        import PyPDF2
+
+        output_dir = self.config['Locations']['reportlocation']
 
         merger = PyPDF2.PdfFileMerger()
 
-        for f in merge_list:
-            merger.append(f)
+        #The pdf pages are kept on disk in page order and only read while the report is written
+        for pdf in self.pdfPages:
+            merger.append(pdf)
 
         save_as = os.path.join(output_dir,'{0}.pdf'.format(self.reportFileName))
         merger.write(save_as) 
         merger.close()
 
         return
-    
-    def generate( self ):
 
-        file_loader = FileSystemLoader(self.config['Locations']['templatelocation']) 
-        env = Environment(loader=file_loader,trim_blocks=True)
-        self.template = env.get_template('template.html') 
+    def __loadTemplate( self ):
 
-        #Get date and time
-        self.datetime_of_report = datetime.datetime.today()
+        #Compile the template once per process, however many reports are generated
+        location = self.config['Locations']['templatelocation']
+
+        if location not in _templates:
+            from jinja2 import Environment, FileSystemLoader
+
+            file_loader = FileSystemLoader(location) 
+            env = Environment(loader=file_loader,trim_blocks=True)
+            _templates[location] = env.get_template('template.html') 
+
+        self.template = _templates[location]
+
+        return
+
+    def __getstate__( self ):
+        #The compiled template cannot be sent to worker processes, so it is reloaded there
+        state = self.__dict__.copy()
+        state.pop('template', None)
+        return state
+
+    def __setstate__( self , state ):
+        self.__dict__.update(state)
+        self.__loadTemplate()
+
+    def __pages( self ):
 
         #Get the total number of entries
         num_of_rows  = self.mtab_df.shape[0]
-    
-        #Get the number of rows per page
-        self.num_rows_per_page = int(self.config['ReportFormat']['numberofrowsperpage'])
         
         #Calculate the number of pages based on the config where the number of entries per page is set
         num_of_pages = int(np.ceil(num_of_rows / self.num_rows_per_page))
 
+        pages = []
+
         row = 0
         for page_no in range( 1 , num_of_pages+1 ):
             start_row = row
@@ -288,17 +724,216 @@ class QtReport:
             if end_row > num_of_rows-1:
                 end_row = num_of_rows-1
 
-            #Export the current page 
-            self.__generateOnePDF( page_no , start_row , end_row )
+            pages.append( (page_no , start_row , end_row) )
 
             row = end_row+1
 
-        #Merge PDFs
-        self.__mergePDFs()
+        return pages
+    
+    def __startReport( self ):
+
+        #Fail before rendering anything if the timings could not be exported
+        self.__timingFormat()
+
+        self.__loadTemplate()
+
+        #Get date and time
+        self.datetime_of_report = datetime.datetime.today()
+
+        #What every page shows besides its own entries and plot
+        self.context = {
+                            'report_file_name': self.reportFileName,
+                            'air_port_name': self.airportName,
+                            'way_name': self.wayName,
+                            'agent_name': self.agentName,
+                            'date_of_report': QtUtils.getDate(self.datetime_of_report),
+                            'time_of_report': QtUtils.getTime(self.datetime_of_report)
+                       }
+
+        #Format the entries of the summary table once for all the pages
+        self.tableRows = tableRows(self.mtab_df)
+    
+        #Get the number of rows per page
+        self.num_rows_per_page = int(self.config['ReportFormat']['numberofrowsperpage'])
+
+        return self.__pages()
+
+    def __finishReport( self ):
+        #Keep the survey and tidy up once the report has been written
+        self.__recordSurvey()
+
+        if self.pageCache is not None:
+            cache_size = self.config['ReportFormat'].getfloat('incrementalcachesize', fallback=256.0)
+
+            if cache_size < 0:
+                raise ValueError('incrementalCacheSize must not be negative, not {0:g}'.format(cache_size))
+
+            self.pageCache.prune(int(cache_size*1024*1024))
+
+        return
+
+    def generate( self ):
+
+        with self.timer.stage('generate'):
+            self.__generate()
+
+        self.__exportTiming()
+
+        return
+
+    def __generate( self ):
+
+        pages = self.__startReport()
+
+        #Get the number of worker processes (1 renders the pages in this process, 0 uses every core)
+        num_of_workers = self.config['ReportFormat'].getint('numberofworkers', fallback=1)
+        if num_of_workers <= 0:
+            num_of_workers = os.cpu_count()
+
+        #The trend page, if any, follows the pages of the lights
+        trend_page_no = len(pages) + 1
+
+        if self.__singleDocument():
+            #The document is laid out in one pass, so it needs every page at once
+            prepared = list(self.__iterPages(pages, num_of_workers))
+
+            trend = self.__prepareTrend(trend_page_no)
+            if trend is not None:
+                prepared.append(trend)
+
+            self.__writeDocument(prepared)
+        else:
+            #Keep only the page being rendered in memory and the rendered ones on disk
+            with self.__spoolFolder() as spool:
+                self.pdfPages = [ self.__spool(spool, page[0], pdf) for page, pdf in zip(pages, self.__iterPages(pages, num_of_workers)) ]
+
+                trend = self.__prepareTrend(trend_page_no)
+                if trend is not None:
+                    self.pdfPages.append(self.__spool(spool, trend_page_no, self.__renderPage(*trend)))
+
+                #Merge PDFs
+                self.__mergePDFs()
+
+            self.pdfPages = []
+
+        self.__finishReport()
+
+        return
+
+    def __iterPages( self , pages , num_of_workers ):
+        #Yield the result of generatePage for each page in page order, as soon as it is ready
+        if num_of_workers == 1 or len(pages) <= 1:
+            #Export the pages one after another
+            for page, index in zip(pages, self.__pageIndices(pages)):
+                yield self.generatePage(*page, index)
+        else:
+            #Fan the pages out to worker processes, keeping the futures in page order
+            with ProcessPoolExecutor( max_workers=min(num_of_workers,len(pages)) , initializer=_initWorker , initargs=(self,) ) as executor:
+                futures = collections.deque()
+
+                for page, index in zip(pages, self.__pageIndices(pages)):
+                    #Bound the number of pages waiting in the pool or for their turn
+                    if len(futures) >= 2*num_of_workers:
+                        yield self.__pageResult(futures.popleft())
 
-        #Delete temp files
-        dir = self.config['Locations']['templocation']
-        for f in os.listdir(dir):
-           os.remove(os.path.join(dir,f))
+                    futures.append(executor.submit(_renderPage, page, index))
 
-        return
\ No newline at end of file
+                while futures:
+                    yield self.__pageResult(futures.popleft())
+
+    def __pageResult( self , future ):
+        result, records = future.result()
+        self.timer.extend(records)
+        return result
+
+    def __spoolFolder( self ):
+        #A private folder in the temp folder for the pdfs of the pages, removed once they are merged
+        return tempfile.TemporaryDirectory( prefix='{0}-'.format(self.reportFileName) , dir=self.config['Locations']['templocation'] )
+
+    def __spool( self , folder , page_no , pdf ):
+
+        save_as = os.path.join(folder, '{0}.pdf'.format(page_no))
+
+        with open( save_as , 'wb' ) as page_file:
+            page_file.write(pdf)
+
+        return save_as
+
+    async def generateAsync( self , progress=None , executor=None ):
+        #Generate the report without blocking the event loop: every CPU stage runs in executor
+        #(the loop's default thread pool if None) and progress, if given, is called with a
+        #QtProgress after each stage. Cancelling the task stops the report between two stages.
+        #The stages share the state of the report, so executor must run them in this process:
+        #a ThreadPoolExecutor. Set numberOfWorkers to spread the pages over processes instead.
+        if executor is not None and not isinstance(executor, ThreadPoolExecutor):
+            raise TypeError('generateAsync runs its stages in threads of this process and needs a ThreadPoolExecutor, not {0}'.format(type(executor).__name__))
+
+        with self.timer.stage('generate'):
+            await self.__generateAsync(progress, executor)
+
+        self.__exportTiming()
+
+        return
+
+    async def __generateAsync( self , progress , executor ):
+
+        loop = asyncio.get_running_loop()
+
+        async def run(function, *args):
+            return await loop.run_in_executor(executor, functools.partial(function, *args))
+
+        async def runPage(page_no, function, *args):
+            #The page is profiled in the thread rendering it
+            return await run(self.__profiled, page_no, function, *args)
+
+        async def emit(stage, page_no=None):
+            if progress is not None:
+                result = progress(QtProgress(stage, page_no, len(pages)))
+                if inspect.isawaitable(result):
+                    await result
+
+        pages = await run(self.__startReport)
+        indices = self.__pageIndices(pages)
+
+        prepared = []
+        self.pdfPages = []
+
+        #Keep only the page being rendered in memory and the rendered ones on disk
+        with self.__spoolFolder() as spool:
+            for page in pages:
+                index = await run(next, indices)
+
+                page_data, plot = await runPage(page[0], self.__preparePage, *page, index)
+                await emit('plotted', page[0])
+
+                if self.__singleDocument():
+                    prepared.append((page_data, plot))
+                else:
+                    pdf = await runPage(page[0], self.__renderPage, page_data, plot)
+                    self.pdfPages.append(await run(self.__spool, spool, page[0], pdf))
+                    await emit('rendered', page[0])
+
+            trend_page_no = len(pages) + 1
+            trend = await run(self.__prepareTrend, trend_page_no)
+
+            if trend is not None:
+                if self.__singleDocument():
+                    prepared.append(trend)
+                else:
+                    pdf = await run(self.__renderPage, *trend)
+                    self.pdfPages.append(await run(self.__spool, spool, trend_page_no, pdf))
+
+            if self.__singleDocument():
+                await run(self.__writeDocument, prepared)
+                await emit('rendered')
+            else:
+                await run(self.__mergePDFs)
+
+        self.pdfPages = []
+
+        await run(self.__finishReport)
+
+        #The report has been written
+        await emit('merged')
+
+        return
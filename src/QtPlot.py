@@ -0,0 +1,216 @@
+import threading
+import numpy as np
+
+#Image formats the contours can be saved in; dpi only applies to the rasters
+IMAGE_FORMATS = ('png', 'jpg', 'svg')
+
+MIME_TYPES = { 'png': 'image/png', 'jpg': 'image/jpeg', 'svg': 'image/svg+xml' }
+
+#Ways of drawing the contours: cubic interpolation onto a grid, or onto a refined triangulation
+CONTOUR_BACKENDS = ('grid', 'tri')
+
+#URL scheme under which the pages refer to plots kept in memory
+PLOT_SCHEME = 'qtplot:'
+
+class QtColourScale:
+
+    def __init__(self , levels , cticks , cmap='Spectral_r' ):
+        #The contour levels and the colours of the bands between them are shared by every page of a report
+        from matplotlib import colormaps
+        from matplotlib.colors import Normalize, BoundaryNorm, ListedColormap
+
+        self.levels = np.asarray(levels, dtype=np.float64)
+        self.cticks = cticks
+
+        #Bands below the first and above the last level are open-ended, as with contourf(extend='both')
+        self.bounds = np.r_[-np.inf, self.levels, np.inf]
+
+        #Colour each band by its middle level, clipped to the colour map like contourf does
+        colours = colormaps[cmap](Normalize(self.levels[0], self.levels[-1], clip=True)(np.r_[self.levels[0], 0.5*(self.levels[:-1]+self.levels[1:]), self.levels[-1]]))
+        self.colours = colours
+
+        #The colour bar shows the bands between the levels and the open-ended ones as its ends
+        self.cmap = ListedColormap(colours[1:-1])
+        self.cmap.set_under(colours[0])
+        self.cmap.set_over(colours[-1])
+        self.norm = BoundaryNorm(self.levels, len(self.levels)-1)
+
+class QtContourFigure:
+
+    def __init__(self , ncols ):
+        #Draw straight onto an Agg canvas, leaving pyplot and any GUI backend out of it
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.figure = Figure(figsize=(50,6))
+        self.canvas = FigureCanvasAgg(self.figure)
+
+        self.axes = self.figure.subplots(nrows=1, ncols=ncols, squeeze=False)[0]
+        self.figure.subplots_adjust(wspace=0.01, left=0.025, right=0.8)
+
+        self.figure.supxlabel('Horizontal Degrees')
+        self.figure.supylabel('Vertical Degrees')
+        self.figure.suptitle('Vertical Scanning')
+
+        self.bar_ax = self.figure.add_axes([0.82, 0.15, 0.001, 0.80])
+        self.bar_scale = None
+
+        #Artists drawn for the current page
+        self.artists = []
+
+    def __clear( self ):
+
+        for artist in self.artists:
+            artist.remove()
+
+        self.artists = []
+
+    def __contours( self , ax , X , Y , Z , scale ):
+        #Trace the lines and bands of one light with a single contour generator, tracing each
+        #kind for all the levels at once rather than once per level as contour and contourf do
+        import contourpy
+        from matplotlib.path import Path
+        from matplotlib.collections import LineCollection, PathCollection
+
+        generator = contourpy.contour_generator( X , Y , np.ma.masked_invalid(Z) , name='serial' , corner_mask=True ,
+                                                 line_type=contourpy.LineType.Separate , fill_type=contourpy.FillType.OuterCode )
+
+        #Paths of the bands, without the ones the light does not reach
+        paths = []
+        colours = []
+        for (points, codes), colour in zip(generator.multi_filled(scale.bounds), scale.colours):
+            if len(points):
+                paths.append(Path(np.concatenate(points), np.concatenate(codes)))
+                colours.append(colour)
+
+        bands = PathCollection(paths, facecolors=colours, edgecolors='none', linewidths=0, antialiaseds=False, zorder=1)
+        lines = LineCollection([ line for level in generator.multi_lines(scale.levels) for line in level ], colors='k', linewidths=0.4, linestyles='dashed', zorder=2)
+
+        ax.add_collection(bands, autolim=False)
+        ax.add_collection(lines, autolim=False)
+
+        return [bands, lines]
+
+    def __tricontours( self , ax , triangulation , z , scale ):
+        #Trace the lines and bands of one light on a refined triangulation shared by its sampling layout
+        lines = ax.tricontour(triangulation, z, levels=scale.levels, linewidths=0.4, linestyles='dashed', colors='k')
+
+        #The colours of the open-ended bands come first and last, as contourf(extend='both') expects them
+        bands = ax.tricontourf(triangulation, z, levels=scale.levels, colors=scale.colours, extend='both')
+
+        return [lines, bands]
+
+    def draw( self , XI , YI , Z , Ids , Hmax , Vmax , * , scale , save_as=None , image_format=None , dpi=400 ):
+        #Draw the lights interpolated onto grids, with XI, YI and Z as returned by QtGridEngine.gridCube
+        contours = lambda ax, row: self.__contours(ax, XI[row], YI[row], Z[row], scale)
+        limits = lambda row: (XI[row][0], XI[row][-1], YI[row][0], YI[row][-1])
+
+        self.__drawLights( len(Z) , contours , limits , Ids , Hmax , Vmax , scale , save_as , image_format , dpi )
+
+        return
+
+    def drawTri( self , refined , Ids , Hmax , Vmax , * , scale , save_as=None , image_format=None , dpi=400 ):
+        #Draw the lights refined onto triangulations, with refined as returned by QtTriEngine.refineMany
+        contours = lambda ax, row: self.__tricontours(ax, refined[row][0], refined[row][1], scale)
+        limits = lambda row: (refined[row][0].x.min(), refined[row][0].x.max(), refined[row][0].y.min(), refined[row][0].y.max())
+
+        self.__drawLights( len(refined) , contours , limits , Ids , Hmax , Vmax , scale , save_as , image_format , dpi )
+
+        return
+
+    def __drawLights( self , nSubplots , contours , limits , Ids , Hmax , Vmax , scale , save_as , image_format , dpi ):
+
+        self.__clear()
+
+        #Determine whether to disable the axis for each (row,col)
+        for row, ax in enumerate(self.axes):
+            if row < nSubplots:
+                ax.axis('on')
+            else:
+                ax.axis('off')
+                ax.set_title('')
+
+        #plot the contour for each entry
+        for row in range(nSubplots):
+            ax = self.axes[row]
+
+            artists = contours(ax, row)
+
+            marker = ax.plot([Hmax[row]],[Vmax[row]],marker='X',color='black')
+
+            ax.set_title('Light ID: {0}'.format(Ids[row]),fontsize=10)
+
+            #Fit the axes to this light alone rather than to every light drawn on them so far
+            xmin, xmax, ymin, ymax = limits(row)
+            ax.set_xlim(xmin, xmax)
+            ax.set_ylim(ymin, ymax)
+
+            self.artists.extend(artists + marker)
+
+        #The colour bar only changes along with the colour scale
+        if self.bar_scale is not scale:
+            from matplotlib.cm import ScalarMappable
+
+            self.bar_ax.clear()
+            self.figure.colorbar(ScalarMappable(norm=scale.norm, cmap=scale.cmap), cax=self.bar_ax, ticks=scale.cticks, extend='both')
+            self.bar_scale = scale
+
+        if save_as is not None:
+            self.save( save_as , image_format , dpi )
+
+        return
+
+    def save( self , save_as , image_format=None , dpi=400 ):
+        #Rasterize and encode the drawn page, saving it to a file name or a file object such as io.BytesIO
+        self.figure.savefig( save_as , format=image_format , dpi=dpi , bbox_inches='tight' )
+
+        return
+
+def drawTrend(trend, icao, save_as, image_format=None, dpi=400):
+    #Plot the median and 10th percentile %ICAO of the lights of each survey of a way, with the
+    #number of lights below icao, from QtSurveyStore.trend
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure(figsize=(25,6))
+    FigureCanvasAgg(figure)
+
+    ax = figure.subplots()
+    surveys = np.arange(len(trend))
+
+    ax.plot(surveys, trend['median'].values, marker='o', color='black', label='Median %ICAO')
+    ax.plot(surveys, trend['p10'].values, marker='o', linestyle='dashed', color='black', label='10th percentile %ICAO')
+    ax.axhline(icao, color='red', linewidth=0.8, label='{0:g}% ICAO'.format(icao))
+
+    bars = ax.twinx()
+    bars.bar(surveys, trend['below'].values, width=0.3, color='grey', alpha=0.4, label='Lights below {0:g}% ICAO'.format(icao))
+    bars.set_ylabel('Lights below {0:g}% ICAO'.format(icao))
+    #Keep the lines in front of the bars
+    ax.set_zorder(bars.get_zorder()+1)
+    ax.patch.set_visible(False)
+
+    ax.set_xticks(surveys)
+    ax.set_xticklabels([ timestamp.strftime('%d/%m/%Y %H:%M') for timestamp in trend.index ])
+    ax.set_xlabel('Survey')
+    ax.set_ylabel('%ICAO')
+    ax.set_title('Trend over the surveys of this way')
+
+    handles, labels = ax.get_legend_handles_labels()
+    more_handles, more_labels = bars.get_legend_handles_labels()
+    ax.legend(handles + more_handles, labels + more_labels, loc='upper right')
+
+    figure.savefig( save_as , format=image_format , dpi=dpi , bbox_inches='tight' )
+
+    return
+
+#The figures of each thread of this process, one per number of columns
+_figures = threading.local()
+
+def contourFigure(ncols):
+    #Each process or thread, e.g. each worker rendering pages, builds its figure once and reuses it
+    figures = _figures.__dict__
+
+    if ncols not in figures:
+        figures[ncols] = QtContourFigure(ncols)
+
+    return figures[ncols]
@@ -0,0 +1,241 @@
+import os
+import json
+import hashlib
+import datetime
+import functools
+import numpy as np
+import pandas as pd
+import QtCache
+
+#Bump whenever the layout of a survey changes
+SURVEY_VERSION = 1
+
+#Names of the folders of the surveys, which sort in the order they were taken
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S%f'
+
+def _content(table):
+    #Fingerprint the values of a summary table; labels are hashed as text
+    parts = [ table.index.values ]
+    for column in table.columns:
+        values = table[column]
+        if isinstance(values.dtype, pd.CategoricalDtype) or values.dtype == object:
+            parts.append(values.astype(str).tolist())
+        else:
+            parts.append(np.asarray(values))
+    return QtCache.fingerprint(*parts)
+
+def _sorted(table):
+    #Surveys are stored and searched sorted by Light ID
+    return table.iloc[np.argsort(table.index.values, kind='stable')]
+
+def siteKey(airport_name, way_name):
+    #Folder of the surveys of a way of an airport, whatever characters their names hold
+    return hashlib.sha256('{0}|{1}'.format(airport_name, way_name).encode('utf-8')).hexdigest()[:32]
+
+class QtSurveyStore:
+
+    def __init__(self , location ):
+        #Every report appends its summary table as a survey of its way, which is never changed
+        #afterwards. Each survey is a folder of .npy columns sorted by Light ID, which is what
+        #the queries of single lights search instead of reading the surveys whole.
+        self.location = location
+
+        if not os.path.exists(self.location):
+            os.makedirs(self.location)
+
+    def __site( self , airport_name , way_name ):
+        return os.path.join(self.location, siteKey(airport_name, way_name))
+
+    def __readMeta( self , folder ):
+        try:
+            with open(os.path.join(folder, 'meta.json')) as meta_file:
+                meta = json.load(meta_file)
+        except OSError:
+            return None
+
+        if meta.get('version') != SURVEY_VERSION:
+            return None
+
+        return meta
+
+    def surveys( self , airport_name , way_name ):
+        #Return the folders and descriptions of the surveys of a way, oldest first
+        site = self.__site(airport_name, way_name)
+
+        if not os.path.isdir(site):
+            return []
+
+        found = []
+        for name in sorted(os.listdir(site)):
+            #Surveys still being written are staged under a name of their own
+            if name.endswith('.tmp') or not os.path.isdir(os.path.join(site, name)):
+                continue
+
+            meta = self.__readMeta(os.path.join(site, name))
+            if meta is not None:
+                found.append((os.path.join(site, name), meta))
+
+        return found
+
+    def append( self , airport_name , way_name , timestamp , mtab_df , report_file_name=None ):
+        #Store a summary table as the survey of a way taken at timestamp and return its timestamp.
+        #A table already stored for the way, e.g. by generating the same report again, is not stored twice.
+        table = _sorted(mtab_df)
+
+        content = _content(table)
+
+        for folder, meta in self.surveys(airport_name, way_name):
+            if meta['content'] == content:
+                return datetime.datetime.fromisoformat(meta['timestamp'])
+
+        site = self.__site(airport_name, way_name)
+        target = os.path.join(site, timestamp.strftime(TIMESTAMP_FORMAT))
+
+        if os.path.exists(target):
+            raise ValueError('A survey of {0}, {1} taken at {2} is already stored'.format(airport_name, way_name, timestamp.isoformat()))
+
+        #Write into a private folder first so that readers never see a partial survey
+        staging = '{0}.{1}.tmp'.format(target, os.getpid())
+        os.makedirs(staging)
+
+        columns = { 'Light ID': ('id', table.index) }
+        for n, name in enumerate(table.columns):
+            columns[name] = ('column-{0}'.format(n), table[name])
+
+        meta = {
+                    'version': SURVEY_VERSION,
+                    'airport_name': airport_name,
+                    'way_name': way_name,
+                    'timestamp': timestamp.isoformat(),
+                    'report_file_name': report_file_name,
+                    'content': content,
+                    'columns': list(table.columns),
+                    'data': QtCache.writeColumns(staging, columns)
+               }
+
+        with open(os.path.join(staging, 'meta.json'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+        os.replace(staging, target)
+
+        return timestamp
+
+    def __columns( self , folder , meta , names=None ):
+        #Memory-map the given columns of a survey, or all of them
+        data = meta['data']
+        if names is not None:
+            data = { name: data[name] for name in names }
+        return QtCache.readColumns(folder, data)
+
+    def __sources( self , airport_name , way_name , pending=None ):
+        #Return the timestamp, column names and a reader of the columns of every survey of a way,
+        #oldest first. pending is a (timestamp, summary table) not stored yet, e.g. of the report
+        #being made, which comes last unless the same table is stored already.
+        sources = []
+        contents = set()
+
+        for folder, meta in self.surveys(airport_name, way_name):
+            sources.append((datetime.datetime.fromisoformat(meta['timestamp']), meta['columns'], functools.partial(self.__columns, folder, meta)))
+            contents.add(meta['content'])
+
+        if pending is not None:
+            timestamp, table = pending
+            table = _sorted(table)
+
+            if _content(table) not in contents:
+                sources.append((timestamp, list(table.columns), functools.partial(self.__tableColumns, table)))
+
+        return sources
+
+    def __tableColumns( self , table , names=None ):
+        #The given columns of a summary table in memory, or all of them, as __columns reads them
+        if names is None:
+            names = [ 'Light ID' ] + list(table.columns)
+
+        columns = {}
+        for name in names:
+            if name == 'Light ID':
+                columns[name] = table.index.values
+            elif isinstance(table[name].dtype, pd.CategoricalDtype):
+                columns[name] = table[name].values
+            else:
+                columns[name] = table[name].to_numpy()
+
+        return columns
+
+    def survey( self , airport_name , way_name , survey=-1 ):
+        #Return the summary table of a survey of a way, the last one by default
+        surveys = self.surveys(airport_name, way_name)
+
+        if not surveys:
+            return None
+
+        folder, meta = surveys[survey]
+        columns = self.__columns(folder, meta)
+        ids = columns.pop('Light ID')
+
+        #Copy the columns out of the memory-mapped files
+        data = { name: values if isinstance(values, pd.Categorical) else np.array(values) for name, values in columns.items() }
+
+        return pd.DataFrame(data, columns=meta['columns'], index=pd.Index(np.array(ids), name='Light ID'))
+
+    def history( self , airport_name , way_name , light_ids , column='%ICAO' , pending=None ):
+        #Return column for the given lights in every survey of a way, one row per light and one
+        #column per survey timestamp, NaN where a light was not surveyed
+        light_ids = np.atleast_1d(np.asarray(light_ids))
+
+        values = {}
+
+        for timestamp, names, read in self.__sources(airport_name, way_name, pending):
+            if column not in names:
+                continue
+
+            columns = read(('Light ID', column))
+            ids = np.asarray(columns['Light ID'])
+
+            picked = np.full(len(light_ids), np.nan, dtype=object if isinstance(columns[column], pd.Categorical) else np.float64)
+
+            if len(ids):
+                #The ids of a survey are sorted, so each light is found by bisection
+                positions = np.minimum(np.searchsorted(ids, light_ids), len(ids)-1)
+                found = ids[positions] == light_ids
+                picked[found] = np.asarray(columns[column][positions[found]])
+
+            values[timestamp] = picked
+
+        return pd.DataFrame(values, index=pd.Index(light_ids, name='Light ID'))
+
+    def below( self , airport_name , way_name , icao , survey=-1 , pending=None ):
+        #Return the rows of a survey, the last one by default, of the lights below icao %ICAO, worst first
+        sources = self.__sources(airport_name, way_name, pending)
+
+        if not sources:
+            return None
+
+        timestamp, names, read = sources[survey]
+        columns = read()
+
+        rows = np.flatnonzero(np.asarray(columns['%ICAO']) < icao)
+        rows = rows[np.argsort(np.asarray(columns['%ICAO'])[rows], kind='stable')]
+
+        ids = np.asarray(columns.pop('Light ID'))[rows]
+
+        return pd.DataFrame({ name: values[rows] for name, values in columns.items() }, columns=names, index=pd.Index(ids, name='Light ID'))
+
+    def trend( self , airport_name , way_name , icao , column='%ICAO' , pending=None ):
+        #Summarize column over the lights of each survey of a way, with the number of lights below icao %ICAO
+        rows = []
+
+        for timestamp, names, read in self.__sources(airport_name, way_name, pending):
+            columns = read({ column, '%ICAO' })
+            values = np.asarray(columns[column], dtype=np.float64)
+
+            rows.append({
+                            'timestamp': timestamp,
+                            'lights': len(values),
+                            'median': np.nanmedian(values) if len(values) else np.nan,
+                            'p10': np.nanpercentile(values, 10) if len(values) else np.nan,
+                            'below': int(np.count_nonzero(np.asarray(columns['%ICAO']) < icao))
+                        })
+
+        return pd.DataFrame(rows, columns=('timestamp', 'lights', 'median', 'p10', 'below')).set_index('timestamp')
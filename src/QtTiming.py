@@ -0,0 +1,179 @@
+import json
+import time
+import cProfile
+import contextlib
+import tracemalloc
+
+#Formats the timings of a report can be exported in, with the extension of their file
+TIMING_FORMATS = { 'json': 'json', 'prometheus': 'prom' }
+
+#Prefix of the exported Prometheus metrics
+METRIC_PREFIX = 'quintus'
+
+def _add(totals, record):
+    #Fold one timed stage into running totals
+    totals['count'] = totals.get('count', 0) + 1
+    totals['wall'] = totals.get('wall', 0.0) + record['wall']
+    totals['cpu'] = totals.get('cpu', 0.0) + record['cpu']
+
+    if record['peak'] is not None:
+        totals['peak'] = max(totals.get('peak') or 0, record['peak'])
+    else:
+        totals.setdefault('peak', None)
+
+    return totals
+
+def _label(value):
+    #Escape a Prometheus label value
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class QtTimer:
+
+    def __init__(self , enabled=True , trace_memory=False ):
+        self.enabled = enabled
+        self.traceMemory = trace_memory
+
+        #One record per timed stage: its name, page (None for the whole report), wall and cpu
+        #seconds and, when memory is traced, the peak of the memory allocated in bytes
+        self.records = []
+
+        #Running peaks of the stages being timed, innermost last
+        self.peaks = []
+
+        self.profiler = None
+
+    def stage( self , name , page_no=None ):
+        #Time the code run in a with block; the cpu time is that of the thread running it
+        if not self.enabled:
+            return contextlib.nullcontext()
+
+        return self.__measure(name, page_no)
+
+    @contextlib.contextmanager
+    def __measure( self , name , page_no ):
+
+        if self.traceMemory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+            #Keep the peak reached so far by the enclosing stage before measuring this one alone
+            if self.peaks:
+                self.peaks[-1] = max(self.peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self.peaks.append(0)
+
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+
+        try:
+            yield
+        finally:
+            record = {
+                        'stage': name,
+                        'page_no': page_no,
+                        'wall': time.perf_counter() - wall,
+                        'cpu': time.thread_time() - cpu,
+                        'peak': None
+                     }
+
+            if self.traceMemory:
+                record['peak'] = max(self.peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self.peaks:
+                    self.peaks[-1] = max(self.peaks[-1], record['peak'])
+
+            self.records.append(record)
+
+    @contextlib.contextmanager
+    def profile( self , save_as ):
+        #Profile the code run in a with block with cProfile and write the statistics gathered
+        #so far to save_as, to be read with pstats or snakeviz
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+
+        self.profiler.enable()
+        try:
+            yield
+        finally:
+            self.profiler.disable()
+            self.profiler.dump_stats(save_as)
+
+    def drain( self ):
+        #Hand over the records timed so far, e.g. from a worker process to the report
+        records = self.records
+        self.records = []
+        return records
+
+    def extend( self , records ):
+        self.records.extend(records)
+
+    def summary( self ):
+        #Aggregate the records per stage and per page
+        stages = {}
+        pages = {}
+
+        for record in self.records:
+            _add(stages.setdefault(record['stage'], {}), record)
+
+            if record['page_no'] is not None:
+                _add(pages.setdefault(record['page_no'], {}), record)
+
+        return { 'stages': stages, 'pages': dict(sorted(pages.items())) }
+
+    def toJSON( self , report=None ):
+
+        summary = self.summary()
+
+        return json.dumps({
+                            'report': report,
+                            'stages': summary['stages'],
+                            'pages': { str(page_no): totals for page_no, totals in summary['pages'].items() },
+                            'records': self.records
+                          }, indent=2)
+
+    def toPrometheus( self , report=None ):
+        #Export the totals in the Prometheus text exposition format
+        summary = self.summary()
+
+        metrics = (
+                    ('wall', 'seconds', 'Wall time spent', 'gauge'),
+                    ('cpu', 'seconds', 'CPU time spent', 'gauge'),
+                    ('peak', 'bytes', 'Peak memory allocated', 'gauge'),
+                    ('count', 'total', 'Number of times run', 'counter')
+                  )
+
+        lines = []
+
+        for scope, key in (('stage', 'stages'), ('page', 'pages')):
+            for field, unit, description, metric_type in metrics:
+                name = '{0}_{1}_{2}_{3}'.format(METRIC_PREFIX, scope, field, unit)
+
+                lines.append('# HELP {0} {1} in each {2} of a report'.format(name, description, scope))
+                lines.append('# TYPE {0} {1}'.format(name, metric_type))
+
+                for label, totals in summary[key].items():
+                    if totals[field] is None:
+                        continue
+
+                    lines.append('{0}{{report="{1}",{2}="{3}"}} {4}'.format(name, _label(report), scope, _label(label), totals[field]))
+
+        return '\n'.join(lines) + '\n'
+
+    def write( self , save_as , timing_format='json' , report=None ):
+
+        if timing_format == 'prometheus':
+            text = self.toPrometheus(report)
+        else:
+            text = self.toJSON(report)
+
+        with open(save_as, 'w', encoding='utf-8') as timing_file:
+            timing_file.write(text)
+
+        return
+
+    def __getstate__( self ):
+        #Worker processes only send back what they time themselves
+        state = self.__dict__.copy()
+        state['records'] = []
+        state['peaks'] = []
+        state['profiler'] = None
+        return state
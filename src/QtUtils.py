@@ -1,6 +1,6 @@
 import os
+import time
 import logging
-import pip
 from functools import wraps
 
 def getPath(path):
@@ -13,15 +13,30 @@ def getDate(datetime):
     date = datetime.date().strftime('%d/%m/%Y')
     return date
 
+#Logger of the calls to the functions decorated with logRuntimeInfo
+_runtime_logger = logging.getLogger('QtRuntime')
+
+def _runtimeLogger():
+    #Log to runtime.log from the first call on, leaving the logging of the application alone on import
+    if not _runtime_logger.handlers:
+        handler = logging.FileHandler('runtime.log', delay=True)
+        handler.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+        _runtime_logger.addHandler(handler)
+        _runtime_logger.setLevel(logging.INFO)
+
+    return _runtime_logger
+
 def logRuntimeInfo(orig_func):
-    logging.basicConfig(filename='runtime.log'.format(orig_func.__name__), level=logging.INFO)
     
     @wraps(orig_func)
     def logRuntimeInfoWrapper(*args, **kwargs):
-        logging.info(
-            '{0} ran with args: {1}, and kwargs: {2}'.format(orig_func.__name__,args, kwargs)
-        )
-        return orig_func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return orig_func(*args, **kwargs)
+        finally:
+            _runtimeLogger().info(
+                '{0} ran in {1:.6f}s with args: {2}, and kwargs: {3}'.format(orig_func.__name__, time.perf_counter()-start, args, kwargs)
+            )
 
     return logRuntimeInfoWrapper
 
@@ -48,5 +63,3 @@ if __name__ == '__main__':
     path = 'C:\\Workspace\\Quintus\\'
     print('\tPath: ',path)
     print('\tFull Path: ',os.path.join(path,__file__))
-
-    #pip.main(['install', 'pypdf2'])
\ No newline at end of file
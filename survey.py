@@ -0,0 +1,58 @@
+import sys
+import os
+import argparse
+
+curDir = os.path.abspath(os.getcwd())
+srcDir = os.path.join(curDir,'src')
+sys.path.append(curDir)
+sys.path.append(srcDir)
+
+import pandas as pd
+import QtConfigure
+import QtSurvey
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Query the surveys stored by the reports of a way')
+    parser.add_argument('airport_name', help='airport the way belongs to, as given to its reports')
+    parser.add_argument('way_name', help='way the lights are on, as given to its reports')
+
+    queries = parser.add_subparsers(dest='query', required=True)
+
+    queries.add_parser('surveys', help='list the surveys of the way')
+
+    history = queries.add_parser('history', help='show a column of some lights in every survey of the way')
+    history.add_argument('light_ids', type=int, nargs='+', help='ids of the lights')
+    history.add_argument('--column', default='%ICAO', help='column of the summary table to show (default: %%ICAO)')
+
+    below = queries.add_parser('below', help='list the lights below a %%ICAO in a survey of the way')
+    below.add_argument('icao', type=float, help='%%ICAO the lights fall short of')
+    below.add_argument('--survey', type=int, default=-1, help='position of the survey, the last one (-1) by default')
+
+    trend = queries.add_parser('trend', help='summarize %%ICAO over the surveys of the way')
+    trend.add_argument('icao', type=float, help='%%ICAO the lights below which are counted')
+
+    args = parser.parse_args()
+
+    config = QtConfigure.getConfig()
+    store = QtSurvey.QtSurveyStore( config['Locations'].get('surveylocation', fallback=os.path.join(os.path.dirname(config['Locations']['reportlocation']),'surveys')) )
+
+    if not store.surveys(args.airport_name, args.way_name):
+        print('No surveys of {0}, {1} are stored in {2}'.format(args.airport_name, args.way_name, store.location), file=sys.stderr)
+        sys.exit(1)
+
+    pd.set_option('display.width', None)
+    pd.set_option('display.max_rows', None)
+
+    if args.query == 'surveys':
+        for folder, meta in store.surveys(args.airport_name, args.way_name):
+            print('{0}  {1}'.format(meta['timestamp'], meta['report_file_name']))
+    elif args.query == 'history':
+        print(store.history(args.airport_name, args.way_name, args.light_ids, args.column).T)
+    elif args.query == 'below':
+        print(store.below(args.airport_name, args.way_name, args.icao, args.survey))
+    else:
+        print(store.trend(args.airport_name, args.way_name, args.icao))
+
+if __name__ == '__main__':
+    main()